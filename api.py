@@ -0,0 +1,143 @@
+import io
+import subprocess
+from collections.abc import Iterable
+from pathlib import Path
+from typing import IO
+from lexer import Lexer, Token
+from preprocessor import Preprocessor, UnsupportedConstruct
+from parser import Program
+from tacky import TackyProgram
+from assembly_generator import AssemblyProgram, check_pass_names
+from assembly_emission import AssemblyEmitter
+from instrumentation import Instrumentation
+from pipeline import parse_tokens, lower_program
+
+
+# Where compile_string may stop, in pipeline order, and what it returns:
+# list[Token], Program, TackyProgram, AssemblyProgram or the assembly text
+STOPS = ("tokens", "ast", "tacky", "assembly", "text")
+
+
+class CompileError(Exception):
+    """The source was rejected; the exception raised by the stage is the cause."""
+
+    stage = "compile"
+
+
+class PreprocessError(CompileError):
+    stage = "preprocess"
+
+
+class LexError(CompileError):
+    stage = "lex"
+
+
+class ParseError(CompileError):
+    stage = "parse"
+
+
+class CodegenError(CompileError):
+    stage = "codegen"
+
+
+def compile_string(
+    source: str,
+    stop: str = "text",
+    opt_level: int = 0,
+    preprocess: bool = True,
+    include_paths: Iterable[str | Path] = (),
+    asm_passes: list[str] | None = None,
+    stats: Instrumentation | None = None,
+) -> list[Token] | Program | TackyProgram | AssemblyProgram | str:
+
+    # Everything happens in memory on objects owned by this call, so any
+    # number of threads may compile at once. Nothing is written to disk
+    # and errors are raised as CompileError, never printed or exited on.
+    # The stages are the driver's; pass stats to collect its timings and
+    # counts.
+    if stop not in STOPS:
+        raise ValueError(f"Unknown stop '{stop}', expected one of: {', '.join(STOPS)}")
+    if asm_passes is not None:
+        check_pass_names(asm_passes)
+    if preprocess:
+        source = preprocess_string(source, include_paths)
+
+    lexer = Lexer.from_source(source)
+    if stop == "tokens":
+        try:
+            return lexer.tokenize()
+        except ValueError as e:
+            raise LexError(str(e)) from e
+
+    # The parser pulls tokens from the lexer lazily, so errors of either
+    # stage surface here
+    try:
+        ast: Program = parse_tokens(lexer.stream(), stats)
+    except ValueError as e:
+        raise LexError(str(e)) from e
+    except SyntaxError as e:
+        raise ParseError(str(e)) from e
+    if stop == "ast":
+        return ast
+
+    try:
+        result = lower_program(
+            ast,
+            stats,
+            opt_level,
+            asm_passes,
+            stop="tacky" if stop == "tacky" else "assembly",
+        )
+        if stop in ("tacky", "assembly"):
+            return result
+        # The same text the driver writes to a .s file
+        out = io.StringIO()
+        AssemblyEmitter(result).emit_to(out)
+        return out.getvalue()
+    except ValueError as e:
+        raise CodegenError(str(e)) from e
+
+
+def compile_stream(
+    stream: IO,
+    stop: str = "text",
+    opt_level: int = 0,
+    preprocess: bool = True,
+    include_paths: Iterable[str | Path] = (),
+    asm_passes: list[str] | None = None,
+    stats: Instrumentation | None = None,
+) -> list[Token] | Program | TackyProgram | AssemblyProgram | str:
+    # Text or binary (UTF-8) streams; the stream is read but not closed
+    source = stream.read()
+    if isinstance(source, bytes):
+        try:
+            source = source.decode()
+        except UnicodeDecodeError as e:
+            raise LexError(str(e)) from e
+    return compile_string(
+        source, stop, opt_level, preprocess, include_paths, asm_passes, stats
+    )
+
+
+def preprocess_string(source: str, include_paths: Iterable[str | Path] = ()) -> str:
+
+    # The built-in preprocessor handles the common subset; anything else is
+    # piped through gcc -E, which reads the source from stdin
+    include_paths = [Path(path) for path in include_paths]
+    try:
+        return Preprocessor(include_paths).preprocess_source(source)
+    except UnsupportedConstruct:
+        pass
+    include_flags = [f"-I{path}" for path in include_paths]
+    try:
+        result = subprocess.run(
+            ["gcc", "-E", "-P", "-x", "c", *include_flags, "-", "-o", "-"],
+            input=source,
+            capture_output=True,
+            text=True,
+        )
+    except OSError as e:
+        raise PreprocessError(f"Could not run gcc -E: {e}") from e
+    if result.returncode != 0:
+        raise PreprocessError(f"Preprocessing failed:\n{result.stderr}")
+    return result.stdout
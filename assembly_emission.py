@@ -1,3 +1,6 @@
+import io
+from collections.abc import Iterator
+from typing import IO
 from assembly_generator import (
     AllocateStack,
     AssemblyProgram,
@@ -14,75 +17,140 @@ from assembly_generator import (
     Stack,
     Unary,
 )
+from dispatch import TypeDispatch
+
+
+REGISTER_NAMES: dict[Register, str] = {
+    Register.EAX: "%eax",
+    Register.ECX: "%ecx",
+    Register.EDX: "%edx",
+    Register.ESI: "%esi",
+    Register.EDI: "%edi",
+    Register.R8: "%r8d",
+    Register.R9: "%r9d",
+    Register.R10: "%r10d",
+    Register.R11: "%r11d",
+}
+
+
+UNARY_OPCODES: dict[type, str] = {
+    Neg: "negl",
+    Not: "notl",
+}
+
+# Register operands never change, so their text is known up front
+REGISTER_OPERANDS: dict[Reg, str] = {
+    Reg(register): name for register, name in REGISTER_NAMES.items()
+}
+
+# Lines buffered before each write to the output stream
+EMIT_BUFFER_LINES = 4096
 
 
 class AssemblyEmitter:
     def __init__(self, assembly_ast: AssemblyProgram) -> None:
         self.assembly_ast: AssemblyProgram = assembly_ast
+        # Operands are immutable, so each distinct one is formatted once
+        self.operand_strings: dict[AssemblyOperand, str] = dict(REGISTER_OPERANDS)
+        self.lines_written = 0
 
     def emit(self) -> str:
-        lines = []
-
+        out = io.StringIO()
+        self.emit_to(out)
+        return out.getvalue().removesuffix("\n")
+
+    def emit_to(self, stream: IO, buffer_lines: int = EMIT_BUFFER_LINES) -> int:
+        # Write the program to a text or binary stream, one newline-terminated
+        # line per instruction, in batches of buffer_lines. Returns the
+        # number of characters written.
+        binary = not isinstance(stream, io.TextIOBase)
+        written = 0
+        batch: list[str] = []
+        for line in self.lines():
+            batch.append(line)
+            if len(batch) >= buffer_lines:
+                written += self.write_batch(stream, batch, binary)
+                batch = []
+        if batch:
+            written += self.write_batch(stream, batch, binary)
+        return written
+
+    def write_batch(self, stream: IO, batch: list[str], binary: bool) -> int:
+        batch.append("")
+        text = "\n".join(batch)
+        self.lines_written += text.count("\n")
+        stream.write(text.encode() if binary else text)
+        return len(text)
+
+    def lines(self) -> Iterator[str]:
         func = self.assembly_ast.function_definition
 
-        lines.append(f"    .globl {func.name}")
-        lines.append(f"{func.name}:")
-        lines.append("    pushq %rbp")
-        lines.append("    movq %rsp, %rbp")
+        yield f"    .globl {func.name}"
+        yield f"{func.name}:"
+        yield "    pushq %rbp"
+        yield "    movq %rsp, %rbp"
 
+        resolve = self.instruction_emitters.resolve
         for instr in func.instructions:
-            lines.append("    " + self.emit_instruction(instr))
+            yield "    " + resolve(type(instr))(self, instr)
 
-        lines.append('    .section .note.GNU-stack,"",@progbits')
+        yield '    .section .note.GNU-stack,"",@progbits'
 
-        return "\n".join(lines)
+    instruction_emitters = TypeDispatch("Unknown instruction type: {name}")
+    operand_emitters = TypeDispatch("Unknown operand type: {name}")
 
     def emit_instruction(self, instr: AssemblyInstruction) -> str:
+        return self.instruction_emitters(self, instr)
 
-        match instr:
-            case Mov(src, dst):
-                src_str = self.emit_operand(src)
-                dst_str = self.emit_operand(dst)
-                return f"movl {src_str}, {dst_str}"
-
-            case Unary(unary_operator, operand):
-                op_str = self.emit_unary_operator(unary_operator)
-                operand_str = self.emit_operand(operand)
-                return f"{op_str} {operand_str}"
+    @instruction_emitters.register(Mov)
+    def emit_mov(self, instr: Mov) -> str:
+        src_str = self.emit_operand(instr.src)
+        dst_str = self.emit_operand(instr.dst)
+        return f"movl {src_str}, {dst_str}"
 
-            case AllocateStack(val):
-                return f"subq ${val}, %rsp"
+    @instruction_emitters.register(Unary)
+    def emit_unary(self, instr: Unary) -> str:
+        op_str = self.emit_unary_operator(instr.unary_operator)
+        operand_str = self.emit_operand(instr.operand)
+        return f"{op_str} {operand_str}"
 
-            case Ret():
-                # Function epilogue: restore stack and return
-                return "movq %rbp, %rsp\n    popq %rbp\n    ret"
+    @instruction_emitters.register(AllocateStack)
+    def emit_allocate_stack(self, instr: AllocateStack) -> str:
+        return f"subq ${instr.val}, %rsp"
 
-            case _:
-                raise ValueError(f"Unknown instruction type: {type(instr).__name__}")
+    @instruction_emitters.register(Ret)
+    def emit_ret(self, instr: Ret) -> str:
+        # Function epilogue: restore stack and return
+        return "movq %rbp, %rsp\n    popq %rbp\n    ret"
 
     def emit_unary_operator(self, operator: AssemblyUnaryOperator):
-        match operator:
-            case Neg():
-                return "negl"
-            case Not():
-                return "notl"
-            case _:
-                raise ValueError(f"Unknown operand type: {type(operator).__name__}")
+        opcode = UNARY_OPCODES.get(type(operator))
+        if opcode is None:
+            raise ValueError(f"Unknown operand type: {type(operator).__name__}")
+        return opcode
 
     def emit_operand(self, operand: AssemblyOperand):
+        try:
+            return self.operand_strings[operand]
+        except KeyError:
+            text = self.operand_emitters(self, operand)
+            self.operand_strings[operand] = text
+            return text
+
+    @operand_emitters.register(ImmediateValue)
+    def emit_immediate(self, operand: ImmediateValue) -> str:
+        return f"${operand.value}"
+
+    @operand_emitters.register(Reg)
+    def emit_register(self, operand: Reg) -> str:
+        return self.get_register_name(operand.register)
 
-        match operand:
-            case ImmediateValue():
-                return f"${operand.value}"
-            case Reg():
-                return self.get_register_name(operand.register)
-            case Stack(val):
-                return f"{val}(%rbp)"
-            case _:
-                raise ValueError(f"Unknown operand type: {type(operand).__name__}")
+    @operand_emitters.register(Stack)
+    def emit_stack(self, operand: Stack) -> str:
+        return f"{operand.val}(%rbp)"
 
     def get_register_name(self, register: Register) -> str:
-        mapping = {Register.EAX: "%eax", Register.R10: "%r10d"}
-        if register not in mapping:
+        name = REGISTER_NAMES.get(register)
+        if name is None:
             raise ValueError(f"Unknown register: {register.name}")
-        return mapping[register]
+        return name
@@ -1,12 +1,18 @@
+from __future__ import annotations
 from dataclasses import dataclass
 from abc import ABC
 from enum import Enum
+from typing import TYPE_CHECKING
+from pass_manager import Pass, PassManager
+from dispatch import TypeDispatch
+from tacky_optimizer import wrap_int32
 from tacky import (
     TackyProgram,
     TackyFunction,
     TackyInstruction,
     TackyReturn,
     TackyUnary,
+    TackyCopy,
     TackyVal,
     TackyConstant,
     TackyVar,
@@ -15,92 +21,167 @@ from tacky import (
     TackyNegate,
 )
 
+if TYPE_CHECKING:
+    from register_allocator import RegisterAllocator
+
 
 class AssemblyInstruction(ABC):
-    pass
+    __slots__ = ()
 
 
 class AssemblyOperand(ABC):
-    pass
+    __slots__ = ()
 
 
 class AssemblyUnaryOperator(ABC):
-    pass
+    __slots__ = ()
 
 
 class Register(Enum):
     EAX = "EAX"
+    ECX = "ECX"
+    EDX = "EDX"
+    ESI = "ESI"
+    EDI = "EDI"
+    R8 = "R8"
+    R9 = "R9"
     R10 = "R10"
+    R11 = "R11"
 
 
-@dataclass
+@dataclass(slots=True)
 class AssemblyProgram:
     function_definition: "AssemblyFunction"
 
 
-@dataclass
+@dataclass(slots=True)
 class AssemblyFunction:
     name: str
     instructions: list[AssemblyInstruction]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Mov(AssemblyInstruction):
     src: AssemblyOperand
     dst: AssemblyOperand
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Unary(AssemblyInstruction):
     unary_operator: AssemblyUnaryOperator
     operand: AssemblyOperand
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AllocateStack(AssemblyInstruction):
     val: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Ret(AssemblyInstruction):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Neg(AssemblyUnaryOperator):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Not(AssemblyUnaryOperator):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ImmediateValue(AssemblyOperand):
     value: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Reg(AssemblyOperand):
     register: Register
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Pseudo(AssemblyOperand):
     identifier: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Stack(AssemblyOperand):
     val: int
 
 
+# Stateless instructions, operators and registers are shared singletons
+RET = Ret()
+NEG = Neg()
+NOT = Not()
+REGISTERS: dict[Register, Reg] = {register: Reg(register) for register in Register}
+EAX = REGISTERS[Register.EAX]
+R10 = REGISTERS[Register.R10]
+
+
+DEFAULT_PASSES = ["generate", "allocate-registers", "replace-pseudos", "fix-mov"]
+# Without these, pseudos or memory-to-memory moves would reach the emitter
+REQUIRED_PASSES = ["generate", "replace-pseudos", "fix-mov"]
+
+
+def check_pass_names(pass_names: list[str]) -> None:
+    # The order is fixed; a selection may only leave out optional passes
+    unknown = [name for name in pass_names if name not in DEFAULT_PASSES]
+    if unknown:
+        raise ValueError(f"Unknown assembly pass: {', '.join(unknown)}")
+    missing = [name for name in REQUIRED_PASSES if name not in pass_names]
+    if missing:
+        raise ValueError(f"Missing required assembly pass: {', '.join(missing)}")
+    if pass_names != [name for name in DEFAULT_PASSES if name in pass_names]:
+        order = ",".join(DEFAULT_PASSES)
+        raise ValueError(f"Assembly passes must run in the order: {order}")
+
+
 class AssemblyGenerator:
-    def __init__(self, tacky_program: TackyProgram) -> None:
+    def __init__(
+        self,
+        tacky_program: TackyProgram,
+        register_allocator: RegisterAllocator | None = None,
+        pass_names: list[str] | None = None,
+        time_passes: bool = False,
+    ) -> None:
         self.tacky_program = tacky_program
-        self.pseudo_map: dict[str, Stack] = {}
+        # Without an allocator every pseudo gets its own stack slot (-O0)
+        self.register_allocator = register_allocator
+        self.pseudo_map: dict[str, AssemblyOperand] = {}
         self.current_offset = 0
+        # Operands are immutable, so each distinct one is built only once
+        self.immediates: dict[int, ImmediateValue] = {}
+        self.pseudos: dict[str, Pseudo] = {}
+        self.pass_manager = PassManager(
+            self.select_passes(pass_names or DEFAULT_PASSES), timed=time_passes
+        )
+
+    def available_passes(self) -> dict[str, Pass]:
+        return {
+            "generate": Pass("generate", self.generate_instruction),
+            "allocate-registers": Pass(
+                "allocate-registers",
+                self.allocate_registers,
+                per_instruction=False,
+                requires=("generate",),
+            ),
+            "replace-pseudos": Pass(
+                "replace-pseudos", self.replace_pseudo, requires=("generate",)
+            ),
+            "fix-mov": Pass(
+                "fix-mov", self.fix_mov_instruction, requires=("replace-pseudos",)
+            ),
+        }
+
+    def select_passes(self, pass_names: list[str]) -> list[Pass]:
+        check_pass_names(pass_names)
+        available = self.available_passes()
+        if self.register_allocator is None:
+            pass_names = [name for name in pass_names if name != "allocate-registers"]
+        return [available[name] for name in pass_names]
 
     def generate_assembly_ast(self) -> AssemblyProgram:
 
@@ -110,16 +191,13 @@ class AssemblyGenerator:
 
     def generate_function(self, func: TackyFunction):
 
-        instructions: list[AssemblyInstruction] = self.generate_instructions(func.body)
-        replaced_instructions = self.replace_pseudos(instructions)
-        fixed_instructions: list[AssemblyInstruction] = self.fix_mov_double_address(
-            replaced_instructions
+        # Consecutive per-instruction passes are fused by the pass manager,
+        # so each instruction flows through all of them in one traversal.
+        final_instructions: list[AssemblyInstruction] = self.pass_manager.run(
+            func.body
         )
-        final_instructions = fixed_instructions
         if self.current_offset < 0:
-            final_instructions = [
-                AllocateStack(abs(self.current_offset))
-            ] + fixed_instructions
+            final_instructions.insert(0, AllocateStack(abs(self.current_offset)))
         return AssemblyFunction(
             name=func.name,
             instructions=final_instructions,
@@ -130,22 +208,42 @@ class AssemblyGenerator:
     ) -> list[AssemblyInstruction]:
         assembly_instructions: list[AssemblyInstruction] = []
         for instruction in func_body:
+            assembly_instructions.extend(self.generate_instruction(instruction))
+        return assembly_instructions
+
+    instruction_generators = TypeDispatch("Unknown expression type: {type}")
 
-            match instruction:
+    def generate_instruction(
+        self, instruction: TackyInstruction
+    ) -> list[AssemblyInstruction]:
+        return self.instruction_generators(self, instruction)
 
-                case TackyReturn(val):
-                    assembly_instructions.extend(self.tacky_return_to_assembly_ast(val))
+    @instruction_generators.register(TackyReturn)
+    def generate_return(self, instruction: TackyReturn) -> list[AssemblyInstruction]:
+        return self.tacky_return_to_assembly_ast(instruction.val)
 
-                case TackyUnary(unary_operator, src, dst):
-                    assembly_instructions.extend(
-                        self.tacky_unary_operator_to_assembly_ast(
-                            unary_operator, src, dst
-                        )
-                    )
+    @instruction_generators.register(TackyUnary)
+    def generate_unary(self, instruction: TackyUnary) -> list[AssemblyInstruction]:
+        return self.tacky_unary_operator_to_assembly_ast(
+            instruction.unary_operator, instruction.src, instruction.dst
+        )
 
-                case _:
-                    raise ValueError(f"Unknown expression type: {type(instruction)}")
-        return assembly_instructions
+    @instruction_generators.register(TackyCopy)
+    def generate_copy(self, instruction: TackyCopy) -> list[AssemblyInstruction]:
+        return [
+            Mov(
+                self.convert_tacky_operand_assembly(instruction.src),
+                self.convert_tacky_operand_assembly(instruction.dst),
+            )
+        ]
+
+    def allocate_registers(
+        self, instructions: list[AssemblyInstruction]
+    ) -> list[AssemblyInstruction]:
+        if self.register_allocator is not None:
+            self.pseudo_map = self.register_allocator.allocate(instructions)
+            self.current_offset = -self.register_allocator.stack_size
+        return instructions
 
     def tacky_unary_operator_to_assembly_ast(
         self, unary_operator: TackyUnaryOperator, src: TackyVal, dst: TackyVal
@@ -163,49 +261,86 @@ class AssemblyGenerator:
 
         instructions = []
         assembly_operand: AssemblyOperand = self.convert_tacky_operand_assembly(val)
-        instructions.append(Mov(assembly_operand, Reg(Register.EAX)))
-        instructions.append(Ret())
+        instructions.append(Mov(assembly_operand, EAX))
+        instructions.append(RET)
         return instructions
 
+    unary_operator_converters = TypeDispatch("Unknown TACKY operator type: {type}")
+    operand_converters = TypeDispatch("Unknown TACKY value type: {type}")
+
     def convert_unary_operator_assembly(self, unary_operator: TackyUnaryOperator):
-        match unary_operator:
-            case TackyComplement():
-                return Not()
-            case TackyNegate():
-                return Neg()
-            case _:
-                raise ValueError(f"Unknown TACKY operator type: {type(unary_operator)}")
+        return self.unary_operator_converters(self, unary_operator)
+
+    @unary_operator_converters.register(TackyComplement)
+    def convert_complement(self, unary_operator: TackyComplement):
+        return NOT
+
+    @unary_operator_converters.register(TackyNegate)
+    def convert_negate(self, unary_operator: TackyNegate):
+        return NEG
 
     def convert_tacky_operand_assembly(self, val: TackyVal) -> AssemblyOperand:
-        match val:
-            case TackyConstant(value):
-                return ImmediateValue(value)
-            case TackyVar(identifier):
-                return Pseudo(identifier)
-            case _:
-                raise ValueError(f"Unknown TACKY value type: {type(val)}")
+        return self.operand_converters(self, val)
+
+    @operand_converters.register(TackyConstant)
+    def convert_constant(self, val: TackyConstant) -> AssemblyOperand:
+        immediate = self.immediates.get(val.value)
+        if immediate is None:
+            # An int constant is 32 bits; wider ones are reduced here, as the
+            # optimizer's folding does, rather than left for gas to shorten
+            value = val.value
+            if not -(1 << 31) <= value < (1 << 32):
+                value = wrap_int32(value)
+            immediate = self.immediates[val.value] = ImmediateValue(value)
+        return immediate
+
+    @operand_converters.register(TackyVar)
+    def convert_var(self, val: TackyVar) -> AssemblyOperand:
+        pseudo = self.pseudos.get(val.identifier)
+        if pseudo is None:
+            pseudo = self.pseudos[val.identifier] = Pseudo(val.identifier)
+        return pseudo
 
     def replace_pseudos(self, instructions: list[AssemblyInstruction]):
 
         new_instructions = []
         for instruction in instructions:
+            new_instructions.extend(self.replace_pseudo(instruction))
+        return new_instructions
 
-            match instruction:
-                case Mov(src, dst):
-                    new_src = self.replace_operand(src)
-                    new_dst = self.replace_operand(dst)
-                    new_instructions.append(Mov(new_src, new_dst))
-
-                case Unary(unary_operator, operand):
-                    new_operand = self.replace_operand(operand)
-                    new_instructions.append(Unary(unary_operator, new_operand))
+    pseudo_replacers = TypeDispatch("Unknown instruction type: {name}")
 
-                case _:
-                    new_instructions.append(instruction)
-        return new_instructions
+    def replace_pseudo(
+        self, instruction: AssemblyInstruction
+    ) -> list[AssemblyInstruction]:
+        # Instructions without pseudos are passed through, not rebuilt
+        return self.pseudo_replacers(self, instruction)
+
+    @pseudo_replacers.register(Mov)
+    def replace_mov(self, instruction: Mov) -> list[AssemblyInstruction]:
+        src, dst = instruction.src, instruction.dst
+        new_src = self.replace_operand(src)
+        new_dst = self.replace_operand(dst)
+        if new_src == new_dst:
+            # Coalesced by the register allocator
+            return []
+        if new_src is src and new_dst is dst:
+            return [instruction]
+        return [Mov(new_src, new_dst)]
+
+    @pseudo_replacers.register(Unary)
+    def replace_unary(self, instruction: Unary) -> list[AssemblyInstruction]:
+        new_operand = self.replace_operand(instruction.operand)
+        if new_operand is instruction.operand:
+            return [instruction]
+        return [Unary(instruction.unary_operator, new_operand)]
+
+    @pseudo_replacers.register(AssemblyInstruction)
+    def replace_none(self, instruction: AssemblyInstruction) -> list[AssemblyInstruction]:
+        return [instruction]
 
     def replace_operand(self, operand: AssemblyOperand) -> AssemblyOperand:
-        if isinstance(operand, Pseudo):
+        if type(operand) is Pseudo:
             if operand.identifier not in self.pseudo_map:
                 self.current_offset -= 4
                 self.pseudo_map[operand.identifier] = Stack(self.current_offset)
@@ -215,10 +350,19 @@ class AssemblyGenerator:
     def fix_mov_double_address(self, instructions: list[AssemblyInstruction]):
         new_instructions = []
         for instruction in instructions:
-            match instruction:
-                case Mov(src=Stack(), dst=Stack()):
-                    new_instructions.append(Mov(instruction.src, Reg(Register.R10)))
-                    new_instructions.append(Mov(Reg(Register.R10), instruction.dst))
-                case _:
-                    new_instructions.append(instruction)
+            new_instructions.extend(self.fix_mov_instruction(instruction))
         return new_instructions
+
+    def fix_mov_instruction(
+        self, instruction: AssemblyInstruction
+    ) -> list[AssemblyInstruction]:
+        if (
+            type(instruction) is Mov
+            and type(instruction.src) is Stack
+            and type(instruction.dst) is Stack
+        ):
+            return [
+                Mov(instruction.src, R10),
+                Mov(R10, instruction.dst),
+            ]
+        return [instruction]
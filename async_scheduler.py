@@ -0,0 +1,90 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from driver import CompilerDriver, CompilerOptions, DriverError, assemble_command
+from instrumentation import Instrumentation
+
+
+class AsyncScheduler:
+    """Overlaps the gcc and Python stages of a batch build.
+
+    Each unit is preprocessed, compiled and assembled to an object. gcc runs
+    (-E for sources the built-in preprocessor leaves alone, -c for assembly)
+    are asyncio subprocesses, while the Python stages run one unit at a time
+    on a worker thread, so gcc works on some units while others compile.
+    The compiler thread takes one core, leaving ``jobs - 1`` (at least one)
+    for gcc, and at most ``2 * jobs`` units are in flight, which bounds the
+    preprocessed text held in memory. Results are returned in input order
+    with each unit's reports captured separately, so output does not depend
+    on how the work was interleaved.
+    """
+
+    def __init__(self, options: CompilerOptions, jobs: int) -> None:
+        self.options = options
+        self.jobs = jobs
+
+    def run(
+        self, file_paths: list[str]
+    ) -> list[tuple[Path | Exception, str, Instrumentation]]:
+        return asyncio.run(self.run_all(file_paths))
+
+    async def run_all(
+        self, file_paths: list[str]
+    ) -> list[tuple[Path | Exception, str, Instrumentation]]:
+        self.processes = asyncio.Semaphore(max(1, self.jobs - 1))
+        self.units = asyncio.Semaphore(2 * self.jobs)
+        with ThreadPoolExecutor(max_workers=1) as compiler:
+            self.compiler = compiler
+            return await asyncio.gather(*(self.run_unit(f) for f in file_paths))
+
+    async def run_unit(
+        self, file_path: str
+    ) -> tuple[Path | Exception, str, Instrumentation]:
+        diagnostics = io.StringIO()
+        stats = Instrumentation(self.options.trace_memory)
+        async with self.units:
+            try:
+                cd = CompilerDriver(file_path, self.options, diagnostics, stats)
+                source = cd.preprocess_in_process()
+                if source is None:
+                    source = await self.preprocess(cd)
+                loop = asyncio.get_running_loop()
+                output_file: Path = await loop.run_in_executor(
+                    self.compiler, cd.compile_source, source
+                )
+                if output_file.suffix == ".s":
+                    output_file = await self.assemble(cd, output_file)
+            except Exception as e:
+                return e, diagnostics.getvalue(), stats
+        return output_file, diagnostics.getvalue(), stats
+
+    async def preprocess(self, cd: CompilerDriver) -> str:
+        async with self.processes:
+            with cd.stats.stage("gcc -E", subprocess=True):
+                process = await asyncio.create_subprocess_exec(
+                    *cd.preprocess_command(),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise DriverError(f"Preprocessing failed:\n{stderr.decode()}")
+        return stdout.decode()
+
+    async def assemble(self, cd: CompilerDriver, assembly_file: Path) -> Path:
+        object_file = assembly_file.with_suffix(".o")
+        try:
+            async with self.processes:
+                with cd.stats.stage("gcc -c", subprocess=True):
+                    process = await asyncio.create_subprocess_exec(
+                        *assemble_command(assembly_file, object_file),
+                        stderr=asyncio.subprocess.PIPE,
+                    )
+                    _, stderr = await process.communicate()
+        finally:
+            os.remove(assembly_file)
+        if process.returncode != 0:
+            raise DriverError(f"Assembly failed:\n{stderr.decode()}")
+        return object_file
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import make_dataclass
+from dispatch import TypeDispatch
+from lexer import Lexer
+from parser import Parser
+from tacky import TackyGenerator
+from assembly_generator import AssemblyGenerator
+from assembly_emission import AssemblyEmitter
+from driver import CompilerDriver, CompilerOptions
+
+
+def unary_chain(size: int) -> str:
+    # Alternating operators, since "--" is not accepted by the lexer
+    return f"int main(void) {{ return {'~-' * (size // 2)}1; }}\n"
+
+
+def paren_tower(size: int) -> str:
+    return f"int main(void) {{ return {'(' * size}1{')' * size}; }}\n"
+
+
+def huge_constant(size: int) -> str:
+    # The lexer converts constants with int(), which refuses more digits
+    # than sys.get_int_max_str_digits()
+    limit = sys.get_int_max_str_digits()
+    if limit and size > limit:
+        raise ValueError(f"Constants are limited to {limit} digits")
+    return f"int main(void) {{ return -{'9' * size}; }}\n"
+
+
+def whitespace_heavy(size: int) -> str:
+    # Short gaps between operators, and two runs longer than the lexer's
+    # 64 KiB chunk (from size 2200 up) so that streaming over them is timed
+    gap = " \t\n" * 10
+    run = " \t\n" * (size * 10)
+    body = gap.join(["~", "-"] * (size // 2))
+    return f"int{gap}main{gap}({gap}void{gap}){gap}{{{run}return{gap}{body}{run}1;}}\n"
+
+
+GENERATORS: dict[str, Callable[[int], str]] = {
+    "unary": unary_chain,
+    "parens": paren_tower,
+    "constant": huge_constant,
+    "whitespace": whitespace_heavy,
+}
+
+DEFAULT_SIZES: dict[str, int] = {
+    "unary": 20000,
+    "parens": 20000,
+    "constant": 4000,
+    "whitespace": 20000,
+}
+
+SWEEP_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def end_to_end(source: str, opt_level: int) -> Callable[[], object]:
+    cd = CompilerDriver("benchmark.c", CompilerOptions(opt_level=opt_level))
+
+    def run():
+        assembly_ast = cd.generate_assembly(Lexer.from_source(source).stream())
+        return AssemblyEmitter(assembly_ast).emit_to(io.StringIO())
+
+    return run
+
+
+def stages(source: str) -> dict[str, Callable[[], object]]:
+    # Each stage is timed alone on the previous stage's output, which is
+    # computed once up front
+    tokens = Lexer.from_source(source).tokenize()
+    ast = Parser(tokens).parse_program()
+    tacky_program = TackyGenerator(ast).generate_tacky_ir()
+    assembly_ast = AssemblyGenerator(tacky_program).generate_assembly_ast()
+    return {
+        "lex": lambda: Lexer.from_source(source).tokenize(),
+        "parse": lambda: Parser(tokens).parse_program(),
+        "tacky": lambda: TackyGenerator(ast).generate_tacky_ir(),
+        "codegen": lambda: AssemblyGenerator(tacky_program).generate_assembly_ast(),
+        "emit": lambda: AssemblyEmitter(assembly_ast).emit(),
+        "total-O0": end_to_end(source, 0),
+        "total-O1": end_to_end(source, 1),
+    }
+
+
+def best_time(run: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(
+    sizes: dict[str, int], repeat: int, out=sys.stdout
+) -> dict[str, dict]:
+    results: dict[str, dict] = {}
+    for name, size in sizes.items():
+        source = GENERATORS[name](size)
+        for stage, run in stages(source).items():
+            seconds = best_time(run, repeat)
+            key = f"{name}/{stage}"
+            results[key] = {
+                "size": size,
+                "bytes": len(source),
+                "seconds": seconds,
+                "mb_per_s": len(source) / seconds / 1e6,
+            }
+            print(
+                f"{key:<24} {seconds * 1000:>10.3f} ms  "
+                f"{results[key]['mb_per_s']:>8.2f} MB/s",
+                file=out,
+            )
+    return results
+
+
+def run_sweep(
+    name: str,
+    sizes: list[int],
+    stage_names: list[str],
+    repeat: int,
+    out=sys.stdout,
+) -> dict[str, dict]:
+
+    # Time per unit of size should stay flat if a stage scales linearly
+    results: dict[str, dict] = {}
+    print(f"{'size':>8}  {'stage':<10} {'ms':>12} {'us/op':>10}", file=out)
+    for size in sizes:
+        runs = stages(GENERATORS[name](size))
+        for stage in stage_names:
+            seconds = best_time(runs[stage], repeat)
+            results[f"{name}{size}/{stage}"] = {"size": size, "seconds": seconds}
+            print(
+                f"{size:>8}  {stage:<10} {seconds * 1000:>12.3f} "
+                f"{seconds / size * 1e6:>10.3f}",
+                file=out,
+            )
+    return results
+
+
+def run_token_storage(
+    name: str, size: int, repeat: int, out=sys.stdout
+) -> dict[str, dict]:
+
+    # Memory retained by the lexed tokens of one input, as a list of Token
+    # objects and as a TokenBuffer (driver --compact-tokens), not counting
+    # the source text both are built from, plus lexing and parsing time
+    source = GENERATORS[name](size)
+    lexers = {
+        "list": lambda: Lexer.from_source(source).tokenize(),
+        "buffer": lambda: Lexer.from_source(source).tokenize_compact(),
+    }
+    results: dict[str, dict] = {}
+    for storage, lex in lexers.items():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tokens = lex()
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        count = len(tokens)
+        lex_seconds = best_time(lex, repeat)
+        parse_seconds = best_time(lambda: Parser(tokens).parse_program(), repeat)
+        key = f"tokens-{name}{size}/{storage}"
+        results[key] = {
+            "size": size,
+            "tokens": count,
+            "retained_bytes": retained,
+            "tokens_per_mb": count / (retained / 1e6),
+            "seconds": lex_seconds,
+            "parse_seconds": parse_seconds,
+        }
+        print(
+            f"{key:<28} {count:>8} tokens  {retained / 1e6:>8.2f} MB  "
+            f"{count / (retained / 1e6):>9.0f} tokens/MB  "
+            f"lex {lex_seconds * 1000:>8.1f} ms  parse {parse_seconds * 1000:>8.1f} ms",
+            file=out,
+        )
+        del tokens
+    return results
+
+
+def run_emit(size: int, repeat: int, out=sys.stdout) -> dict[str, dict]:
+
+    # Output bytes per second of writing -O0 code for a unary chain to a
+    # real file, which is what the driver does for each .s
+    tacky_program = TackyGenerator(
+        Parser(Lexer.from_source(unary_chain(size)).tokenize()).parse_program()
+    ).generate_tacky_ir()
+    assembly_ast = AssemblyGenerator(tacky_program).generate_assembly_ast()
+    instructions = len(assembly_ast.function_definition.instructions)
+
+    def write_text(path):
+        with open(path, "w") as f:
+            f.write(AssemblyEmitter(assembly_ast).emit())
+
+    def emit_to(path, mode):
+        with open(path, mode) as f:
+            AssemblyEmitter(assembly_ast).emit_to(f)
+
+    variants = {
+        "emit+write": write_text,
+        "emit_to-text": lambda path: emit_to(path, "w"),
+        "emit_to-binary": lambda path: emit_to(path, "wb"),
+    }
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.s")
+        for name, write in variants.items():
+            seconds = best_time(lambda: write(path), repeat)
+            written = os.path.getsize(path)
+            key = f"emit{size}/{name}"
+            results[key] = {
+                "size": size,
+                "instructions": instructions,
+                "bytes": written,
+                "seconds": seconds,
+                "mb_per_s": written / seconds / 1e6,
+            }
+            print(
+                f"{key:<28} {seconds * 1000:>10.3f} ms  "
+                f"{results[key]['mb_per_s']:>8.2f} MB/s",
+                file=out,
+            )
+    return results
+
+
+def run_server_latency(
+    name: str, size: int, runs: int, out=sys.stdout
+) -> dict[str, dict]:
+
+    # Wall time of compiling one file with -c from the command line: cold
+    # starts the driver in a new interpreter, warm sends the request to a
+    # compile server that has the compiler loaded
+    here = os.path.dirname(os.path.abspath(__file__))
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "benchmark.c"), "w") as f:
+            f.write(GENERATORS[name](size))
+        socket_path = os.path.join(directory, "server.sock")
+        env = {**os.environ, "C_COMPILER_SOCKET": socket_path}
+        commands = {
+            "cold": [sys.executable, os.path.join(here, "driver.py")],
+            "warm": [sys.executable, os.path.join(here, "compile_client.py")],
+        }
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(here, "compile_server.py"),
+                "--socket",
+                socket_path,
+                "--idle-timeout",
+                "0",
+            ]
+        )
+        try:
+            deadline = time.monotonic() + 10
+            while not os.path.exists(socket_path):
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The compile server did not start")
+                time.sleep(0.01)
+
+            def compile_once(command: list[str]) -> float:
+                start = time.perf_counter()
+                subprocess.run(
+                    [*command, "-c", "benchmark.c"], cwd=directory, env=env, check=True
+                )
+                return time.perf_counter() - start
+
+            # The server's first request pays for lazily built tables
+            compile_once(commands["warm"])
+            for mode, command in commands.items():
+                times = [compile_once(command) for _ in range(runs)]
+                key = f"server-{name}{size}/{mode}"
+                results[key] = {
+                    "size": size,
+                    "seconds": min(times),
+                    "median_seconds": statistics.median(times),
+                }
+                print(
+                    f"{key:<28} best {min(times) * 1000:>8.1f} ms  "
+                    f"median {statistics.median(times) * 1000:>8.1f} ms",
+                    file=out,
+                )
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def run_dispatch(
+    type_counts: list[int], nodes: int, repeat: int, out=sys.stdout
+) -> dict[str, dict]:
+
+    # Nodes per second dispatched over N dataclass types, by an in-order
+    # isinstance chain (what a match statement evaluates) and by TypeDispatch
+    results: dict[str, dict] = {}
+    rng = random.Random(0)
+    for count in type_counts:
+        classes = [make_dataclass(f"Node{i}", [("value", int)]) for i in range(count)]
+        table = TypeDispatch("Unknown node type: {name}", arg=0)
+        for i, cls in enumerate(classes):
+            table.register(cls)(lambda node, i=i: i)
+
+        def chain(node):
+            for i, cls in enumerate(classes):
+                if isinstance(node, cls):
+                    return i
+            raise ValueError(f"Unknown node type: {type(node).__name__}")
+
+        items = [rng.choice(classes)(0) for _ in range(nodes)]
+        for name, handler in [("isinstance", chain), ("table", table)]:
+            seconds = best_time(lambda: [handler(item) for item in items], repeat)
+            key = f"dispatch{count}/{name}"
+            results[key] = {"size": nodes, "seconds": seconds}
+            print(
+                f"{key:<24} {seconds * 1000:>10.3f} ms  "
+                f"{nodes / seconds / 1e6:>8.2f} M nodes/s",
+                file=out,
+            )
+    return results
+
+
+def compare(
+    base: dict[str, dict],
+    new: dict[str, dict],
+    threshold: float,
+    min_seconds: float = 0.0,
+    out=sys.stdout,
+) -> list[str]:
+
+    # A benchmark regressed if it got slower by more than threshold (0.1 is
+    # 10%) and by more than min_seconds, which keeps timer noise on very
+    # short stages from being flagged. Benchmarks present in only one file,
+    # or run at different sizes, are not compared.
+    regressions = []
+    for key, result in new.items():
+        old = base.get(key)
+        if old is None or old["size"] != result["size"]:
+            continue
+        change = result["seconds"] / old["seconds"] - 1
+        flag = ""
+        if change > threshold and result["seconds"] - old["seconds"] > min_seconds:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(
+            f"{key:<24} {old['seconds'] * 1000:>10.3f} ms -> "
+            f"{result['seconds'] * 1000:>10.3f} ms  {change:>+8.1%}{flag}",
+            file=out,
+        )
+    return regressions
+
+
+def save_results(path: str, repeat: int, results: dict[str, dict]) -> None:
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def load_results(path: str) -> dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def parse_size(value: str) -> tuple[str, int]:
+    name, _, size = value.partition("=")
+    if name not in GENERATORS or not size.isdigit():
+        raise argparse.ArgumentTypeError(
+            f"expected NAME=SIZE with NAME one of {', '.join(GENERATORS)}"
+        )
+    return name, int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each compiler stage on generated programs"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument(
+        "--size",
+        dest="sizes",
+        type=parse_size,
+        action="append",
+        default=[],
+        metavar="NAME=SIZE",
+        help="run only the named inputs, at the given size "
+        f"(defaults: {', '.join(f'{n}={s}' for n, s in DEFAULT_SIZES.items())})",
+    )
+    run.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="runs per benchmark; the fastest is kept (default: 5)",
+    )
+    run.add_argument("-o", dest="output", help="save the results as JSON")
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare saved results and flag regressions"
+    )
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="flag benchmarks slower by more than this fraction (default: 0.1)",
+    )
+    compare_parser.add_argument(
+        "--min-ms",
+        type=float,
+        default=0.1,
+        help="ignore slowdowns smaller than this many milliseconds (default: 0.1)",
+    )
+
+    sweep = commands.add_parser(
+        "sweep", help="time stages over growing sizes of one input to check scaling"
+    )
+    sweep.add_argument("name", nargs="?", default="unary", choices=GENERATORS)
+    sweep.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=SWEEP_SIZES,
+        help=f"comma-separated sizes (default: {','.join(map(str, SWEEP_SIZES))})",
+    )
+    sweep.add_argument(
+        "--stage",
+        dest="stages",
+        action="append",
+        choices=["lex", "parse", "tacky", "codegen", "emit", "total-O0", "total-O1"],
+        help="stage to time, repeatable (default: all)",
+    )
+    sweep.add_argument("--repeat", type=int, default=3)
+    sweep.add_argument(
+        "--disable-gc",
+        action="store_true",
+        help="turn off the cyclic GC, whose passes over large live ASTs add "
+        "non-linear time",
+    )
+    sweep.add_argument("-o", dest="output", help="save the results as JSON")
+
+    tokens = commands.add_parser(
+        "tokens", help="compare memory per token of list[Token] and TokenBuffer"
+    )
+    tokens.add_argument(
+        "--size",
+        type=parse_size,
+        default=("unary", 100000),
+        metavar="NAME=SIZE",
+        help="input to lex (default: unary=100000)",
+    )
+    tokens.add_argument("--repeat", type=int, default=3)
+    tokens.add_argument("-o", dest="output", help="save the results as JSON")
+
+    emit = commands.add_parser(
+        "emit", help="measure output bytes/s of emitting a large program to a file"
+    )
+    emit.add_argument(
+        "--size",
+        type=int,
+        default=200000,
+        help="operators in the unary chain compiled at -O0 (default: 200000)",
+    )
+    emit.add_argument("--repeat", type=int, default=3)
+    emit.add_argument("-o", dest="output", help="save the results as JSON")
+
+    server = commands.add_parser(
+        "server",
+        help="compare compile latency through the compile server with a cold start",
+    )
+    server.add_argument(
+        "--size",
+        type=parse_size,
+        default=("unary", 100),
+        metavar="NAME=SIZE",
+        help="program to compile with -c (default: unary=100)",
+    )
+    server.add_argument("--runs", type=int, default=20)
+    server.add_argument("-o", dest="output", help="save the results as JSON")
+
+    dispatch = commands.add_parser(
+        "dispatch", help="time node dispatch by isinstance chain and TypeDispatch"
+    )
+    dispatch.add_argument(
+        "--types",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[4, 16, 48],
+        help="comma-separated numbers of node types (default: 4,16,48)",
+    )
+    dispatch.add_argument("--nodes", type=int, default=200000)
+    dispatch.add_argument("--repeat", type=int, default=5)
+    dispatch.add_argument("-o", dest="output", help="save the results as JSON")
+
+    generate = commands.add_parser("generate", help="print a generated program")
+    generate.add_argument("name", choices=GENERATORS)
+    generate.add_argument("size", type=int)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        sys.stdout.write(GENERATORS[args.name](args.size))
+    elif args.command == "sweep":
+        if args.repeat < 1:
+            parser.error("--repeat must be at least 1")
+        if args.disable_gc:
+            gc.disable()
+        stage_names = args.stages or list(stages(GENERATORS[args.name](10)))
+        results = run_sweep(args.name, args.sizes, stage_names, args.repeat)
+        if args.output:
+            save_results(args.output, args.repeat, results)
+    elif args.command == "tokens":
+        if args.repeat < 1:
+            parser.error("--repeat must be at least 1")
+        results = run_token_storage(*args.size, args.repeat)
+        if args.output:
+            save_results(args.output, args.repeat, results)
+    elif args.command == "emit":
+        if args.repeat < 1 or args.size < 1:
+            parser.error("--repeat and --size must be at least 1")
+        results = run_emit(args.size, args.repeat)
+        if args.output:
+            save_results(args.output, args.repeat, results)
+    elif args.command == "server":
+        if args.runs < 1:
+            parser.error("--runs must be at least 1")
+        results = run_server_latency(*args.size, args.runs)
+        if args.output:
+            save_results(args.output, args.runs, results)
+    elif args.command == "dispatch":
+        if args.repeat < 1 or args.nodes < 1:
+            parser.error("--repeat and --nodes must be at least 1")
+        results = run_dispatch(args.types, args.nodes, args.repeat)
+        if args.output:
+            save_results(args.output, args.repeat, results)
+    elif args.command == "run":
+        if args.repeat < 1:
+            parser.error("--repeat must be at least 1")
+        sizes = dict(args.sizes) or DEFAULT_SIZES
+        results = run_benchmarks(sizes, args.repeat)
+        if args.output:
+            save_results(args.output, args.repeat, results)
+    else:
+        regressions = compare(
+            load_results(args.base),
+            load_results(args.new),
+            args.threshold,
+            args.min_ms / 1000,
+        )
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+
+import argparse
+import io
+import json
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import driver
+from benchmark import GENERATORS, parse_size
+
+
+# Each compiler builds an object file from a source file in the same
+# directory. Our compiler runs through driver.run, like the command line.
+COMPILERS: dict[str, list[str]] = {
+    "ours -O0": ["-O", "0"],
+    "ours -O1": ["-O", "1"],
+    "gcc -O0": ["gcc", "-O0"],
+    "gcc -O2": ["gcc", "-O2"],
+}
+
+# Calls a program's main, renamed to bench_main, in a loop and prints the
+# nanoseconds per call. The result goes to a volatile so no call is elided.
+CALL_HARNESS = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+int bench_main(void);
+
+int main(int argc, char **argv) {
+    long calls = atol(argv[1]);
+    volatile int sink;
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    for (long i = 0; i < calls; i++)
+        sink = bench_main();
+    clock_gettime(CLOCK_MONOTONIC, &end);
+    (void)sink;
+    double ns = (end.tv_sec - start.tv_sec) * 1e9 + (end.tv_nsec - start.tv_nsec);
+    printf("%.3f\n", ns / calls);
+    return 0;
+}
+"""
+
+FUNCTION = re.compile(r"[0-9a-f]+ <(.+)>:$")
+FRAME_ALLOCATION = re.compile(r"sub\s+\$0x([0-9a-f]+),%rsp$")
+FRAME_OFFSET = re.compile(r"-0x([0-9a-f]+)\(%rbp\)")
+
+
+@dataclass
+class FunctionMetrics:
+    instructions: int = 0
+    # Explicit memory operands; lea computes an address without accessing
+    # memory and push/pop/call/ret only touch the stack implicitly
+    memory_operands: int = 0
+    # Bytes below %rbp the function uses: its AllocateStack, or for gcc the
+    # deepest slot, since gcc may use the red zone without allocating
+    frame_bytes: int = 0
+    code_bytes: int = 0
+
+
+def disassembly_metrics(object_file: Path) -> dict[str, FunctionMetrics]:
+    result = subprocess.run(
+        ["objdump", "-d", "-w", object_file], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise driver.DriverError(f"objdump failed:\n{result.stderr}")
+    functions: dict[str, FunctionMetrics] = {}
+    current = None
+    for line in result.stdout.splitlines():
+        function = FUNCTION.match(line)
+        if function is not None:
+            current = functions[function.group(1)] = FunctionMetrics()
+            continue
+        fields = line.split("\t")
+        if current is None or len(fields) < 3:
+            continue
+        instruction = fields[2].strip()
+        current.instructions += 1
+        current.code_bytes += len(fields[1].split())
+        mnemonic = instruction.split()[0]
+        if "(" in instruction and mnemonic != "lea":
+            current.memory_operands += 1
+        allocation = FRAME_ALLOCATION.search(instruction)
+        if allocation is not None:
+            current.frame_bytes = max(current.frame_bytes, int(allocation.group(1), 16))
+        for offset in FRAME_OFFSET.findall(instruction):
+            current.frame_bytes = max(current.frame_bytes, int(offset, 16))
+    return functions
+
+
+def run_checked(command: list, what: str) -> subprocess.CompletedProcess:
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise driver.DriverError(f"{what} failed:\n{result.stderr}")
+    return result
+
+
+def compile_object(compiler: str, source: Path, object_file: Path) -> None:
+    flags = COMPILERS[compiler]
+    if flags[0] == "gcc":
+        run_checked([*flags, "-c", source, "-o", object_file], compiler)
+        return
+    err = io.StringIO()
+    status = driver.run(
+        [*flags, "-c", source.name, "-o", object_file.name],
+        str(source.parent),
+        io.StringIO(),
+        err,
+        parallel=False,
+    )
+    if status != 0:
+        raise driver.DriverError(f"{compiler} failed:\n{err.getvalue()}")
+
+
+def time_executions(executable: Path, runs: int) -> tuple[float, int]:
+    # Whole-process time, which for programs this small is mostly exec and
+    # dynamic linking; the exit status is checked against other compilers
+    best = float("inf")
+    status = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        status = subprocess.run([executable]).returncode
+        best = min(best, time.perf_counter() - start)
+    return best, status
+
+
+def time_calls(harness: Path, calls: int, repeat: int = 3) -> float:
+    return min(
+        float(run_checked([harness, str(calls)], "call harness").stdout)
+        for _ in range(repeat)
+    )
+
+
+def measure(
+    source: Path, workdir: Path, harness: Path, runs: int, calls: int
+) -> dict[str, dict]:
+    results: dict[str, dict] = {}
+    for compiler in COMPILERS:
+        stem = f"{source.stem}-{compiler.replace(' ', '')}"
+        object_file = workdir / f"{stem}.o"
+        compile_object(compiler, source, object_file)
+        executable = workdir / stem
+        run_checked(["gcc", object_file, "-o", executable], "link")
+        renamed = workdir / f"{stem}-bench.o"
+        run_checked(
+            ["objcopy", "--redefine-sym", "main=bench_main", object_file, renamed],
+            "objcopy",
+        )
+        bench = workdir / f"{stem}-bench"
+        run_checked(["gcc", harness, renamed, "-o", bench], "link")
+
+        exec_seconds, status = time_executions(executable, runs)
+        results[compiler] = {
+            "functions": {
+                name: asdict(metrics)
+                for name, metrics in disassembly_metrics(object_file).items()
+            },
+            "exit_status": status,
+            "exec_us": exec_seconds * 1e6,
+            "call_ns": time_calls(bench, calls),
+        }
+    return results
+
+
+def print_report(report: dict[str, dict], out=sys.stdout) -> None:
+    header = (
+        f"{'program':<16} {'compiler':<9} {'function':<10} {'insns':>6} "
+        f"{'mem ops':>7} {'frame':>6} {'bytes':>6} {'exec us':>9} {'call ns':>8}"
+    )
+    print(header, file=out)
+    for program, results in report.items():
+        statuses = {result["exit_status"] for result in results.values()}
+        for compiler, result in results.items():
+            for name, metrics in result["functions"].items():
+                print(
+                    f"{program:<16} {compiler:<9} {name:<10} "
+                    f"{metrics['instructions']:>6} {metrics['memory_operands']:>7} "
+                    f"{metrics['frame_bytes']:>6} {metrics['code_bytes']:>6} "
+                    f"{result['exec_us']:>9.1f} {result['call_ns']:>8.2f}",
+                    file=out,
+                )
+        if len(statuses) > 1:
+            print(f"{program}: exit statuses differ: {sorted(statuses)}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the code this compiler generates with gcc -O0 and -O2"
+    )
+    parser.add_argument("c_files", nargs="*", metavar="c_file")
+    parser.add_argument(
+        "--generate",
+        type=parse_size,
+        action="append",
+        default=[],
+        metavar="NAME=SIZE",
+        help="also measure a program from benchmark.py's generators",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=50,
+        help="executions of each binary; the fastest is kept (default: 50)",
+    )
+    parser.add_argument(
+        "--calls",
+        type=int,
+        default=1000000,
+        help="calls of each main in the call-timing loop (default: 1000000)",
+    )
+    parser.add_argument("-o", dest="output", help="save the report as JSON")
+    args = parser.parse_args()
+    if not args.c_files and not args.generate:
+        parser.error("give C files or --generate NAME=SIZE")
+    if args.runs < 1 or args.calls < 1:
+        parser.error("--runs and --calls must be at least 1")
+
+    report: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        workdir = Path(directory)
+        harness_source = workdir / "harness.c"
+        harness_source.write_text(CALL_HARNESS)
+        harness = workdir / "harness.o"
+        # Sources are copied so intermediate files stay out of the corpus
+        sources = []
+        for c_file in args.c_files:
+            sources.append(Path(shutil.copy(c_file, workdir)))
+        for name, size in args.generate:
+            source = workdir / f"{name}{size}.c"
+            source.write_text(GENERATORS[name](size))
+            sources.append(source)
+        try:
+            run_checked(
+                ["gcc", "-O2", "-c", harness_source, "-o", harness], "call harness"
+            )
+            for source in sources:
+                report[source.stem] = measure(
+                    source, workdir, harness, args.runs, args.calls
+                )
+        except driver.DriverError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
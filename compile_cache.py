@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+) / "c_compiler"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+STATS_FILE = "stats.json"
+LOCK_FILE = "stats.lock"
+TEMP_PREFIX = ".tmp-"
+
+
+# The modules whose code decides what ends up in a cached .s or .o; tools
+# such as the benchmarks, the compile server and its client are left out
+# so that editing them keeps the cache valid
+OUTPUT_MODULES = [
+    "assembly_emission.py",
+    "assembly_generator.py",
+    "compile_cache.py",
+    "dispatch.py",
+    "driver.py",
+    "lexer.py",
+    "object_emission.py",
+    "parser.py",
+    "pass_manager.py",
+    "peephole.py",
+    "pipeline.py",
+    "preprocessor.py",
+    "register_allocator.py",
+    "tacky.py",
+    "tacky_optimizer.py",
+]
+
+# Fraction of max_bytes an eviction shrinks the cache to, so that a full
+# cache is not scanned again on every put
+EVICT_TO = 0.9
+
+
+def compiler_fingerprint() -> str:
+    # Hash of the compiler's own sources, so entries from another version
+    # of the compiler are never reused
+    digest = hashlib.sha256()
+    directory = Path(__file__).parent
+    for name in OUTPUT_MODULES:
+        digest.update(name.encode() + b"\0" + (directory / name).read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+COMPILER_FINGERPRINT = compiler_fingerprint()
+
+
+class CompileCache:
+    """Content-addressed store of compiler output.
+
+    Entries live at ``<dir>/<key[:2]>/<key><suffix>`` and are written to a
+    temporary file first and renamed into place, so a reader never sees a
+    partial entry and concurrent writers of the same key are harmless.
+    Reading an entry refreshes its mtime; when the cache grows past
+    ``max_bytes`` the entries with the oldest mtime are removed until it is
+    back under ``EVICT_TO`` of that. Hit and miss counters, and a running
+    total of entry bytes, are shared between processes through a stats file
+    guarded by ``flock``, so the entries are only scanned to evict.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.fingerprint = COMPILER_FINGERPRINT
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, source: str, flags: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self.fingerprint, flags, source):
+            digest.update(part.encode() + b"\0")
+        return digest.hexdigest()
+
+    def entry_path(self, key: str, suffix: str) -> Path:
+        return self.directory / key[:2] / (key + suffix)
+
+    def get(self, key: str, suffix: str) -> bytes | None:
+        path = self.entry_path(key, suffix)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Never stored, or evicted by another process in the meantime
+            self.record("misses")
+            return None
+        self.record("hits")
+        return data
+
+    def put(self, key: str, suffix: str, data: bytes) -> None:
+        path = self.entry_path(key, suffix)
+        path.parent.mkdir(exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(temp_name, path)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+        with self.locked_stats() as stats:
+            if "bytes" in stats:
+                stats["bytes"] += len(data) - replaced
+            else:
+                # A cache from before the running total was kept
+                stats["bytes"] = sum(size for _, size, _ in self.entries())
+            if stats["bytes"] > self.max_bytes:
+                stats["bytes"] = self.evict()
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for shard in self.directory.iterdir():
+            if not shard.is_dir():
+                continue
+            for path in shard.iterdir():
+                if path.name.startswith(TEMP_PREFIX):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        # Called with the stats lock held; returns the bytes left, which
+        # also corrects any drift in the running total
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        target = self.max_bytes * EVICT_TO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def record(self, counter: str) -> None:
+        with self.locked_stats() as stats:
+            stats[counter] = stats.get(counter, 0) + 1
+
+    @contextmanager
+    def locked_stats(self) -> Iterator[dict[str, int]]:
+        # The stats, to be updated in place and written back under the lock
+        with open(self.directory / LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self.read_stats()
+            yield stats
+            stats_path = self.directory / STATS_FILE
+            temp_path = stats_path.with_name(TEMP_PREFIX + STATS_FILE)
+            temp_path.write_text(json.dumps(stats))
+            os.replace(temp_path, stats_path)
+
+    def read_stats(self) -> dict[str, int]:
+        try:
+            return json.loads((self.directory / STATS_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def stats(self) -> dict[str, int]:
+        stats = {"hits": 0, "misses": 0, **self.read_stats()}
+        entries = self.entries()
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+
+import json
+import os
+import socket
+import sys
+
+
+def default_socket() -> str:
+    # $XDG_RUNTIME_DIR is private to the user; otherwise the server creates
+    # a mode 0700 directory of its own under the temporary directory
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "c_compiler.sock")
+    return os.path.join(private_directory(), "compile.sock")
+
+
+def private_directory() -> str:
+    temp_dir = os.environ.get("TMPDIR", "/tmp")
+    return os.path.join(temp_dir, f"c_compiler-{os.getuid()}")
+
+
+DEFAULT_SOCKET = os.environ.get("C_COMPILER_SOCKET") or default_socket()
+
+
+class PartialReplyError(Exception):
+    """The server went away after writing part of its output, so compiling
+    again in this process would repeat that output."""
+
+
+def request(argv: list[str], cwd: str, socket_path: str = DEFAULT_SOCKET) -> int:
+
+    # One JSON line with argv and cwd goes out; the server answers with
+    # {"stream": "out"|"err", "data": ...} lines and finally {"exit": status}.
+    # Only a server run by the same user is trusted with the sources and
+    # with producing the outputs
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} is owned by another user")
+    streamed = False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({"argv": argv, "cwd": cwd}).encode() + b"\n")
+            with sock.makefile("r") as replies:
+                for line in replies:
+                    message = json.loads(line)
+                    if "exit" in message:
+                        return message["exit"]
+                    stream = sys.stdout if message["stream"] == "out" else sys.stderr
+                    stream.write(message["data"])
+                    streamed = True
+        raise ConnectionError("compile server closed the connection before replying")
+    except ConnectionError as e:
+        if streamed:
+            raise PartialReplyError(
+                "compile server closed the connection without a status"
+            ) from e
+        raise
+
+
+def main():
+    # Deliberately imports nothing from the compiler, so the client starts
+    # as fast as the interpreter does
+    argv = sys.argv[1:]
+    try:
+        status = request(argv, os.getcwd())
+    except PartialReplyError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except (FileNotFoundError, ConnectionError, PermissionError) as e:
+        # No server running, one that shut down before answering, or not
+        # ours: compile in this process instead
+        if isinstance(e, PermissionError):
+            print(f"Warning: not using the compile server: {e}", file=sys.stderr)
+        driver = os.path.join(os.path.dirname(os.path.abspath(__file__)), "driver.py")
+        os.execv(sys.executable, [sys.executable, driver, *argv])
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
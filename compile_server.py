@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+import driver
+from compile_client import DEFAULT_SOCKET, private_directory
+
+
+class MessageStream:
+    # Text stream that forwards each write to the client as one message
+    def __init__(self, wfile, name: str, lock: threading.Lock) -> None:
+        self.wfile = wfile
+        self.name = name
+        self.lock = lock
+
+    def write(self, data: str) -> int:
+        if data:
+            message = json.dumps({"stream": self.name, "data": data}) + "\n"
+            with self.lock:
+                self.wfile.write(message.encode())
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            # A connection probe, such as remove_stale_socket's
+            return
+        request = json.loads(line)
+        lock = threading.Lock()
+        out = MessageStream(self.wfile, "out", lock)
+        err = MessageStream(self.wfile, "err", lock)
+        # Requests already run concurrently on threads; forking a
+        # process pool from a threaded server is not safe
+        try:
+            status = driver.run(
+                request["argv"],
+                request["cwd"],
+                out,
+                err,
+                parallel=False,
+                concurrent=True,
+            )
+        except Exception as e:
+            err.write(f"internal compiler error: {type(e).__name__}: {e}\n")
+            status = 1
+        self.wfile.write(json.dumps({"exit": status}).encode() + b"\n")
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, idle_timeout: float) -> None:
+        self.idle_timeout = idle_timeout
+        self.active_requests = 0
+        self.last_activity = time.monotonic()
+        self.activity_lock = threading.Lock()
+        # The server runs gcc for whoever connects, so only its owner may.
+        # The socket is created with mode 0600 rather than changed after
+        # bind, which would leave a window where anyone could connect.
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, CompileRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def process_request(self, request, client_address) -> None:
+        # Counted from accept rather than from the first line read, so the
+        # idle shutdown cannot pick the moment a client has just connected
+        self.begin_request()
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self.end_request()
+            raise
+
+    def process_request_thread(self, request, client_address) -> None:
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.end_request()
+
+    def begin_request(self) -> None:
+        with self.activity_lock:
+            self.active_requests += 1
+
+    def end_request(self) -> None:
+        with self.activity_lock:
+            self.active_requests -= 1
+            self.last_activity = time.monotonic()
+
+    def idle_for(self) -> float:
+        with self.activity_lock:
+            if self.active_requests:
+                return 0.0
+            return time.monotonic() - self.last_activity
+
+    def shutdown_when_idle(self) -> None:
+        while True:
+            idle = self.idle_for()
+            if idle >= self.idle_timeout:
+                self.shutdown()
+                return
+            time.sleep(min(1.0, self.idle_timeout - idle))
+
+
+def check_socket_directory(socket_path: str) -> None:
+    # The fallback directory sits in a shared temporary directory, where
+    # another user could have created it first
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if directory != os.path.abspath(private_directory()):
+        return
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or status.st_mode & 0o077
+    ):
+        raise RuntimeError(f"{directory} must be a directory private to this user")
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    # A socket file nobody listens on is left over from a server that died
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise RuntimeError(f"A compile server is already listening on {socket_path}")
+
+
+def serve(socket_path: str = DEFAULT_SOCKET, idle_timeout: float = 0) -> None:
+    check_socket_directory(socket_path)
+    remove_stale_socket(socket_path)
+    server = CompileServer(socket_path, idle_timeout)
+    try:
+        if idle_timeout > 0:
+            threading.Thread(target=server.shutdown_when_idle, daemon=True).start()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep the compiler loaded and serve compile_client.py requests"
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help=f"Unix socket to listen on (default: {DEFAULT_SOCKET})",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=600,
+        metavar="SECONDS",
+        help="exit after this long without requests; 0 never exits (default: 600)",
+    )
+    args = parser.parse_args()
+    # Leave through serve()'s cleanup, which removes the socket file
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket, args.idle_timeout)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import shutil
+import subprocess
+import pytest
+from assembly_generator import AssemblyFunction, AssemblyProgram
+from assembly_emission import AssemblyEmitter
+from tacky import TACKY_NEGATE, TackyReturn, TackyUnary, TackyVar
+
+
+requires_gcc = pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+
+
+def interpret(body: list, inputs: dict[str, int] | None = None) -> int:
+    # Runs a straight-line TACKY body on 32-bit values; inputs gives the
+    # values of variables read before they are written
+    values: dict[str, int] = dict(inputs or {})
+
+    def value(val) -> int:
+        return values[val.identifier] if type(val) is TackyVar else val.value
+
+    for instruction in body:
+        if type(instruction) is TackyReturn:
+            result = value(instruction.val) & 0xFFFFFFFF
+            return result - (1 << 32) if result & 0x80000000 else result
+        src = value(instruction.src)
+        if type(instruction) is TackyUnary:
+            src = -src if instruction.unary_operator is TACKY_NEGATE else ~src
+        values[instruction.dst.identifier] = src & 0xFFFFFFFF
+    raise AssertionError("body has no return")
+
+
+@pytest.fixture
+def run_functions(tmp_path):
+    # Assembles the given functions into one binary with a C harness that
+    # calls each in turn, and returns their int results in order
+    def run(functions: list[AssemblyFunction]) -> list[int]:
+        # One file per function, since each program ends its .text section
+        assembly_files = []
+        for function in functions:
+            assembly = tmp_path / f"{function.name}.s"
+            with open(assembly, "w") as f:
+                AssemblyEmitter(AssemblyProgram(function)).emit_to(f)
+            assembly_files.append(assembly)
+        names = [function.name for function in functions]
+        harness = tmp_path / "harness.c"
+        harness.write_text(
+            "#include <stdio.h>\n"
+            + "".join(f"int {name}(void);\n" for name in names)
+            + "int main(void) {\n"
+            + "".join(f'    printf("%d\\n", {name}());\n' for name in names)
+            + "    return 0;\n}\n"
+        )
+        executable = tmp_path / "functions"
+        subprocess.run(
+            ["gcc", harness, *assembly_files, "-o", executable],
+            check=True,
+            capture_output=True,
+        )
+        output = subprocess.run(
+            [executable], check=True, capture_output=True, text=True
+        ).stdout
+        return [int(line) for line in output.split()]
+
+    return run
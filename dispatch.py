@@ -0,0 +1,45 @@
+from collections.abc import Callable
+
+
+class TypeDispatch:
+    """Handler table keyed by node class.
+
+    Handlers are registered for a class and found for subclasses by walking
+    the MRO once; the result is cached per concrete type, so dispatching a
+    node is one dict lookup however many node types are registered.
+    ``arg`` is the position of the argument dispatched on (1 for methods,
+    whose first argument is ``self``). ``error`` is formatted with ``{type}``
+    and ``{name}`` of the node when no handler matches.
+    """
+
+    def __init__(self, error: str, arg: int = 1) -> None:
+        self.error = error
+        self.arg = arg
+        self.handlers: dict[type, Callable] = {}
+        self.cache: dict[type, Callable] = {}
+
+    def register(self, *types: type):
+        def decorator(handler: Callable) -> Callable:
+            for cls in types:
+                self.handlers[cls] = handler
+            self.cache.clear()
+            return handler
+
+        return decorator
+
+    def resolve(self, cls: type) -> Callable:
+        handler = self.cache.get(cls)
+        if handler is None:
+            for base in cls.__mro__:
+                if base in self.handlers:
+                    handler = self.handlers[base]
+                    break
+            else:
+                raise ValueError(self.error.format(type=cls, name=cls.__name__))
+            self.cache[cls] = handler
+        return handler
+
+    def __call__(self, *args):
+        cls = type(args[self.arg])
+        handler = self.cache.get(cls) or self.resolve(cls)
+        return handler(*args)
@@ -1,118 +1,712 @@
 #!/usr/bin/env python3
 
 
+import io
+import json
 import os
 import sys
 import argparse
 import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import IO
 from lexer import Lexer, Token
-from parser import Parser, Program
-from assembly_generator import AssemblyProgram, AssemblyGenerator
+from preprocessor import Preprocessor, UnsupportedConstruct
+from compile_cache import CompileCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from instrumentation import Instrumentation
+from parser import Program
+from assembly_generator import AssemblyProgram, DEFAULT_PASSES, check_pass_names
 from assembly_emission import AssemblyEmitter
-from tacky import TackyGenerator, TackyProgram
+from object_emission import ObjectEmitter
+from pipeline import parse_tokens, lower_program
+
+
+class DriverError(Exception):
+    """A preprocessing, assembly or link step failed, or an input is bad."""
+
+
+@dataclass
+class CompilerOptions:
+    opt_level: int = 0
+    opt_report: bool = False
+    asm_passes: list[str] | None = None
+    time_passes: bool = False
+    trace_memory: bool = False
+    integrated_as: bool = False
+    pipe: bool = False
+    external_cpp: bool = False
+    include_paths: list[str] = field(default_factory=list)
+    compile_only: bool = False
+    # Lex each unit into a TokenBuffer up front instead of streaming
+    compact_tokens: bool = False
+    cache: bool = False
+    cache_dir: str = str(DEFAULT_CACHE_DIR)
+    cache_max_bytes: int = DEFAULT_MAX_BYTES
 
 
 class CompilerDriver:
-    def __init__(self, file_path: str):
+    def __init__(
+        self,
+        file_path: str,
+        options: CompilerOptions | None = None,
+        err: IO[str] | None = None,
+        stats: Instrumentation | None = None,
+    ):
+        self.options: CompilerOptions = options or CompilerOptions()
+        # Optimizer and pass reports go here
+        self.err: IO[str] = err if err is not None else sys.stderr
+        # Stage timings and counts, always collected since they are cheap
+        self.stats: Instrumentation = (
+            stats
+            if stats is not None
+            else Instrumentation(self.options.trace_memory)
+        )
+        self.stats.count("units")
         self.file_path: Path = Path(file_path)
         self.path: Path = (
             self.file_path.parent if self.file_path.parent != Path() else Path(".")
         )
         self.file_name: str = self.file_path.name
+        self.cache: CompileCache | None = (
+            CompileCache(Path(self.options.cache_dir), self.options.cache_max_bytes)
+            if self.options.cache
+            else None
+        )
 
     def generate_preprocess_file(self) -> Path:
 
         preprocess_file_name: str = self.file_name.rsplit(".", 1)[0] + ".i"
         preprocess_file = self.path / preprocess_file_name
 
-        result = subprocess.run(
-            ["gcc", "-E", "-P", self.file_path, "-o", preprocess_file],
-            capture_output=True,
-            text=True,
-        )
+        preprocessed: str = self.preprocess_to_string()
+        with open(preprocess_file, "w") as f:
+            f.write(preprocessed)
 
-        if result.returncode != 0:
-            print("Preprocessing failed:")
-            print(result.stderr)
-            sys.exit(1)
         return preprocess_file
 
+    def preprocess_to_string(self) -> str:
+
+        # Handle the common subset in-process; gcc only sees files that use
+        # something the built-in preprocessor does not support
+        source = self.preprocess_in_process()
+        if source is not None:
+            return source
+
+        with self.stats.stage("gcc -E", subprocess=True):
+            result = subprocess.run(
+                self.preprocess_command(),
+                capture_output=True,
+                text=True,
+            )
+
+        if result.returncode != 0:
+            raise DriverError(f"Preprocessing failed:\n{result.stderr}")
+        return result.stdout
+
+    def preprocess_in_process(self) -> str | None:
+        if self.options.external_cpp:
+            return None
+        try:
+            with self.stats.stage("preprocess"):
+                preprocessor = Preprocessor(self.options.include_paths)
+                return preprocessor.preprocess_file(self.file_path)
+        except UnsupportedConstruct:
+            return None
+
+    def preprocess_command(self) -> list:
+        include_flags = [f"-I{path}" for path in self.options.include_paths]
+        return ["gcc", "-E", "-P", *include_flags, self.file_path, "-o", "-"]
+
+    def cache_key(self, source: str) -> str:
+        # Options that change the emitted output; the source is already
+        # preprocessed, so include paths do not matter
+        flags = json.dumps(
+            [
+                self.options.opt_level,
+                self.options.asm_passes,
+                self.options.integrated_as,
+            ]
+        )
+        return self.cache.key(source, flags)
+
     def compile_preprocess_file(self, preprocess_file: Path):
+        # Lexer streams tokens from the file as the parser asks for them
+        return self.compile_lexer(Lexer(preprocess_file))
 
-        # Lexer produces a list of tokens
-        lex = Lexer(preprocess_file)
-        tokens: list[Token] = lex.tokenize()
+    def compile_source(self, source: str) -> Path:
+        return self.compile_lexer(Lexer.from_source(source))
 
-        # Parser which turns these list of tokens into a AST
-        p = Parser(tokens)
-        ast: Program = p.parse_program()
+    def compile_lexer(self, lex: Lexer) -> Path:
 
-        # IR three-address code (TAC) pass
-        tg = TackyGenerator(ast)
-        tacky_program: TackyProgram = tg.generate_tacky_ir()
+        # On a cache hit the stored output is written out and every stage
+        # from the lexer to the emitter is skipped
+        suffix = ".o" if self.options.integrated_as else ".s"
+        if self.cache is not None:
+            with self.stats.stage("cache"):
+                with lex.open_source() as f:
+                    key = self.cache_key(f.read())
+                cached = self.cache.get(key, suffix)
+            if cached is not None:
+                self.stats.count("cache_hits")
+                output_file = self.path / (self.file_name.rsplit(".", 1)[0] + suffix)
+                output_file.write_bytes(cached)
+                return output_file
 
-        # Assembly generation pass : Convert the Tacky into assembly AST
-        ag: AssemblyGenerator = AssemblyGenerator(tacky_program)
-        assembly_ast: AssemblyProgram = ag.generate_assembly_ast()
+        assembly_ast: AssemblyProgram = self.generate_assembly(self.tokens(lex))
 
-        # Code emission pass : Write that assembly to a file
-        ae: AssemblyEmitter = AssemblyEmitter(assembly_ast)
-        assembly_text: str = ae.emit()
-        assembly_file: Path = self.write_assembly(assembly_text)
-        return assembly_file
+        # Integrated assembler: encode straight into an ELF object file
+        if self.options.integrated_as:
+            output_file = self.write_object(ObjectEmitter(assembly_ast))
+        else:
+            # Code emission pass : Write that assembly to a file
+            ae: AssemblyEmitter = AssemblyEmitter(assembly_ast)
+            output_file = self.write_assembly(ae)
+
+        if self.cache is not None:
+            with self.stats.stage("cache"):
+                self.cache.put(key, suffix, output_file.read_bytes())
+        return output_file
+
+    def compile_in_memory(self):
 
-    def write_assembly(self, assembly_text: str) -> Path:
+        # Preprocessor output is lexed from memory and the assembly is piped
+        # into gcc, so the executable is the only file written
+        source: str = self.preprocess_to_string()
+        if self.cache is None:
+            lex = Lexer.from_source(source)
+            assembly_ast: AssemblyProgram = self.generate_assembly(self.tokens(lex))
+            emitter = AssemblyEmitter(assembly_ast)
+            # Emission feeds gcc as it goes, so the two are timed together
+            with self.stats.stage("emit+link", subprocess=True):
+                self.assemble_and_link_stream(emitter.emit_to)
+            self.stats.count("emitted_lines", emitter.lines_written)
+            return
+
+        with self.stats.stage("cache"):
+            key = self.cache_key(source)
+            assembly: bytes | None = self.cache.get(key, ".s")
+        if assembly is None:
+            lex = Lexer.from_source(source)
+            assembly_ast = self.generate_assembly(self.tokens(lex))
+            buffer = io.BytesIO()
+            emitter = AssemblyEmitter(assembly_ast)
+            with self.stats.stage("emit"):
+                emitter.emit_to(buffer)
+            self.stats.count("emitted_lines", emitter.lines_written)
+            assembly = buffer.getvalue()
+            with self.stats.stage("cache"):
+                self.cache.put(key, ".s", assembly)
+        else:
+            self.stats.count("cache_hits")
+        with self.stats.stage("link", subprocess=True):
+            self.assemble_and_link_stream(lambda stream: stream.write(assembly))
+
+    def tokens(self, lex: Lexer) -> Iterable[Token]:
+        if not self.options.compact_tokens:
+            return lex.stream()
+        # The whole unit is lexed here, and lex+parse then only parses
+        with self.stats.stage("lex"):
+            return lex.tokenize_compact()
+
+    def generate_assembly(self, tokens: Iterable[Token]) -> AssemblyProgram:
+        ast: Program = parse_tokens(tokens, self.stats)
+        return lower_program(
+            ast,
+            self.stats,
+            self.options.opt_level,
+            self.options.asm_passes,
+            self.options.time_passes,
+            self.err if self.options.opt_report else None,
+        )
+
+    def write_assembly(self, emitter: AssemblyEmitter) -> Path:
 
         assembly_file_name: str = self.file_name.rsplit(".", 1)[0] + ".s"
         assembly_file = self.path / assembly_file_name
 
-        with open(assembly_file, "w") as f:
-            f.write(assembly_text)
+        # Stream straight into the file instead of building the text first,
+        # and remove it if that fails so a later step never sees half a file
+        with self.stats.stage("emit"):
+            try:
+                with open(assembly_file, "w") as f:
+                    emitter.emit_to(f)
+            except BaseException:
+                assembly_file.unlink(missing_ok=True)
+                raise
+        self.stats.count("emitted_lines", emitter.lines_written)
 
         return assembly_file
 
+    def write_object(self, emitter: ObjectEmitter) -> Path:
+
+        object_file_name: str = self.file_name.rsplit(".", 1)[0] + ".o"
+        object_file = self.path / object_file_name
+
+        with self.stats.stage("emit"):
+            try:
+                with open(object_file, "wb") as f:
+                    written = emitter.emit_to(f)
+            except BaseException:
+                object_file.unlink(missing_ok=True)
+                raise
+        self.stats.count("object_bytes", written)
+
+        return object_file
+
     def delete_preprocess_file(self, preprocess_file: Path):
         os.remove(preprocess_file)
 
+    def executable_path(self) -> Path:
+        return self.path / self.file_name.rsplit(".", 1)[0]
+
     def assemble_and_link(self, assembly_file: Path):
+        link([assembly_file], self.executable_path())
 
-        executable_file_name: str = self.file_name.rsplit(".", 1)[0]
-        executable_file_path = self.path / executable_file_name
+    def assemble(self, assembly_file: Path) -> Path:
 
-        result = subprocess.run(
-            ["gcc", assembly_file, "-o", executable_file_path],
-            capture_output=True,
-            text=True,
-        )
+        object_file = assembly_file.with_suffix(".o")
+        with self.stats.stage("gcc -c", subprocess=True):
+            result = subprocess.run(
+                assemble_command(assembly_file, object_file),
+                capture_output=True,
+                text=True,
+            )
         if result.returncode != 0:
-            print("Assembly/linking failed:")
-            print(result.stderr)
-            sys.exit(1)
+            raise DriverError(f"Assembly failed:\n{result.stderr}")
+        return object_file
+
+    def assemble_and_link_stream(self, emit_to: Callable[[IO[bytes]], object]):
+
+        executable_file_path = self.executable_path()
+
+        process = subprocess.Popen(
+            ["gcc", "-x", "assembler", "-", "-o", executable_file_path],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Drain stderr while writing so a chatty assembler cannot block us
+        errors: list[bytes] = []
+        reader = threading.Thread(target=lambda: errors.append(process.stderr.read()))
+        reader.start()
+        try:
+            emit_to(process.stdin)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+        reader.join()
+        if returncode != 0:
+            message = b"".join(errors).decode(errors="replace")
+            raise DriverError(f"Assembly/linking failed:\n{message}")
 
     def delete_assembly_file(self, assembly_file: Path):
         os.remove(assembly_file)
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("c_file")
-    args = parser.parse_args()
-    file_path: str = args.c_file
+def assemble_command(assembly_file: Path, object_file: Path) -> list:
+    return ["gcc", "-c", assembly_file, "-o", object_file]
+
+
+def link(inputs: list[Path], executable_file_path: Path):
+
+    # gcc assembles any .s inputs and links everything in one invocation
+    result = subprocess.run(
+        ["gcc", *inputs, "-o", executable_file_path],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise DriverError(f"Assembly/linking failed:\n{result.stderr}")
+
 
+def check_input(name: str, cwd: str):
+    file_path = os.path.join(cwd, name)
     if not os.path.exists(file_path):
-        print(f"Error: File '{file_path}' does not exist.")
-        sys.exit(1)
+        raise DriverError(f"File '{name}' does not exist.")
     if not file_path.endswith(".c"):
-        print("Error: File must be a .c C source file.")
-        sys.exit(1)
-
-    cd = CompilerDriver(file_path)
-    preprocess_file: Path = cd.generate_preprocess_file()
-    assembly_file: Path = cd.compile_preprocess_file(preprocess_file)
-    cd.delete_preprocess_file(preprocess_file)
-    cd.assemble_and_link(assembly_file)
-    cd.delete_assembly_file(assembly_file)
+        raise DriverError("File must be a .c C source file.")
+
+
+def compile_file(
+    file_path: str, options: CompilerOptions
+) -> tuple[Path | Exception, str, Instrumentation]:
+
+    # One translation unit: .s, or .o with -c or --integrated-as, plus any
+    # reports it printed and its statistics. Runs in a worker process in
+    # batch mode, so failures are returned rather than printed.
+    diagnostics = io.StringIO()
+    stats = Instrumentation(options.trace_memory)
+    try:
+        cd = CompilerDriver(file_path, options, diagnostics, stats)
+        preprocess_file: Path = cd.generate_preprocess_file()
+        try:
+            output_file: Path = cd.compile_preprocess_file(preprocess_file)
+        finally:
+            cd.delete_preprocess_file(preprocess_file)
+        if options.compile_only and output_file.suffix == ".s":
+            assembly_file = output_file
+            try:
+                output_file = cd.assemble(assembly_file)
+            finally:
+                cd.delete_assembly_file(assembly_file)
+    except Exception as e:
+        return e, diagnostics.getvalue(), stats
+    return output_file, diagnostics.getvalue(), stats
+
+
+def compile_files(
+    file_paths: list[str], options: CompilerOptions, jobs: int
+) -> list[tuple[Path | Exception, str, Instrumentation]]:
+
+    # Results come back in input order whatever order workers finish in
+    if len(file_paths) <= 1 or jobs == 1:
+        return [compile_file(file_path, options) for file_path in file_paths]
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(file_paths))) as pool:
+        futures = [pool.submit(compile_file, f, options) for f in file_paths]
+        return [future.result() for future in futures]
+
+
+def report_error(name: str, error: Exception, err: IO[str]):
+    if isinstance(error, DriverError):
+        print(f"{name}: error: {error}", file=err)
+    else:
+        print(f"{name}: error: {type(error).__name__}: {error}", file=err)
+
+
+def write_stats(
+    stats: Instrumentation,
+    args: argparse.Namespace,
+    cwd: str,
+    out: IO[str],
+    err: IO[str],
+):
+    if args.time_passes:
+        err.write(stats.format_table())
+    if args.stats is None:
+        return
+    report = json.dumps(stats.as_dict(), indent=2) + "\n"
+    if args.stats == "-":
+        out.write(report)
+    else:
+        with open(os.path.join(cwd, args.stats), "w") as f:
+            f.write(report)
+
+
+def print_cache_stats(options: CompilerOptions, err: IO[str]):
+    cache = CompileCache(Path(options.cache_dir), options.cache_max_bytes)
+    for name, count in cache.stats().items():
+        print(f"cache.{name}: {count}", file=err)
+
+
+class UsageError(Exception):
+    """Raised by DriverArgumentParser where argparse would exit."""
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class DriverArgumentParser(argparse.ArgumentParser):
+    # Help and usage go to the given streams, and exiting raises UsageError,
+    # so arguments can be parsed on behalf of a client without touching
+    # this process's stdout, stderr or lifetime
+    def __init__(self, *args, out: IO[str], err: IO[str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.out = out
+        self.err = err
+
+    def _print_message(self, message: str, file: IO[str] | None = None):
+        if message:
+            (self.err if file is sys.stderr else self.out).write(message)
+
+    def exit(self, status: int = 0, message: str | None = None):
+        if message:
+            self._print_message(message, sys.stderr)
+        raise UsageError(status)
+
+
+def build_parser(out: IO[str], err: IO[str]) -> DriverArgumentParser:
+    parser = DriverArgumentParser(prog="driver.py", out=out, err=err)
+    parser.add_argument("c_files", nargs="+", metavar="c_file")
+    parser.add_argument(
+        "-c",
+        dest="compile_only",
+        action="store_true",
+        help="compile each input to an object file and do not link",
+    )
+    parser.add_argument(
+        "-o",
+        dest="output",
+        default=None,
+        help="name of the executable (or of the object with -c and one input)",
+    )
+    parser.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of files compiled in parallel (default: number of cores)",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="overlap gcc preprocessing and assembly with compilation of other files",
+    )
+    parser.add_argument(
+        "-O",
+        dest="opt_level",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="optimization level (-O1 enables the TACKY optimizer and register allocation)",
+    )
+    parser.add_argument(
+        "--opt-report",
+        action="store_true",
+        help="print optimizer before/after counts to stderr",
+    )
+    parser.add_argument(
+        "--asm-passes",
+        type=lambda value: value.split(","),
+        default=None,
+        help="comma-separated assembly passes to run; the order is fixed and only "
+        f"allocate-registers may be left out (default: {','.join(DEFAULT_PASSES)})",
+    )
+    parser.add_argument(
+        "--time-passes",
+        action="store_true",
+        help="print a table of time spent in each stage and assembly pass, "
+        "and of compilation counts, to stderr",
+    )
+    parser.add_argument(
+        "--stats",
+        default=None,
+        metavar="FILE",
+        help="write stage timings and counts as JSON to FILE ('-' for stdout)",
+    )
+    parser.add_argument(
+        "--stats-memory",
+        action="store_true",
+        help="also record peak memory per stage (slows compilation down)",
+    )
+    parser.add_argument(
+        "--integrated-as",
+        action="store_true",
+        help="encode machine code directly into an ELF object; gcc only links",
+    )
+    parser.add_argument(
+        "--pipe",
+        action="store_true",
+        help="keep intermediate output in memory; only the executable is written",
+    )
+    parser.add_argument(
+        "--compact-tokens",
+        action="store_true",
+        help="lex each input into a compact token buffer before parsing, "
+        "instead of streaming tokens to the parser",
+    )
+    parser.add_argument(
+        "-I",
+        dest="include_paths",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="add a directory to the #include search path",
+    )
+    parser.add_argument(
+        "--external-cpp",
+        action="store_true",
+        help="always preprocess with gcc -E instead of the built-in preprocessor",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse output cached for identical preprocessed source and options",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help=f"compilation cache directory (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        metavar="MB",
+        help="evict least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="print cache hit/miss counts and size to stderr",
+    )
+    return parser
+
+
+def run(
+    argv: list[str],
+    cwd: str,
+    out: IO[str],
+    err: IO[str],
+    parallel: bool = True,
+    concurrent: bool = False,
+) -> int:
+
+    # Whole command line in, exit status out: 0 on success, 1 if an input
+    # or the link failed, 2 for usage errors. Relative paths are taken
+    # against cwd, and nothing is written to this process's own streams,
+    # so a compile server can run this for many clients at once; it passes
+    # concurrent=True, which rules out process-wide memory tracing.
+    parser = build_parser(out, err)
+    try:
+        args = parser.parse_args(argv)
+        validate_args(parser, args)
+        if args.stats_memory and concurrent:
+            parser.error("--stats-memory is not available through the compile server")
+    except UsageError as e:
+        return e.status
+
+    options = CompilerOptions(
+        opt_level=args.opt_level,
+        opt_report=args.opt_report,
+        asm_passes=args.asm_passes,
+        time_passes=args.time_passes,
+        trace_memory=args.stats_memory,
+        integrated_as=args.integrated_as,
+        pipe=args.pipe,
+        external_cpp=args.external_cpp,
+        include_paths=[os.path.join(cwd, path) for path in args.include_paths],
+        cache=args.cache,
+        cache_dir=os.path.join(cwd, args.cache_dir),
+        cache_max_bytes=args.cache_size * 1024 * 1024,
+        compile_only=args.compile_only,
+        compact_tokens=args.compact_tokens,
+    )
+    output = os.path.join(cwd, args.output) if args.output is not None else None
+    jobs = args.jobs if parallel else 1
+    # Memory tracing, if asked for, covers this process's units and stops
+    # once they are done
+    stats = Instrumentation(options.trace_memory)
+    try:
+        status = build(
+            args.c_files, cwd, options, output, jobs, err, args.use_async, stats
+        )
+    finally:
+        stats.stop_tracing()
+    if args.time_passes or args.stats is not None:
+        write_stats(stats, args, cwd, out, err)
+    if args.cache_stats:
+        print_cache_stats(options, err)
+    return status
+
+
+def validate_args(parser: DriverArgumentParser, args: argparse.Namespace):
+    if args.asm_passes is not None:
+        try:
+            check_pass_names(args.asm_passes)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.pipe and args.integrated_as:
+        parser.error("--pipe cannot be combined with --integrated-as")
+    if args.pipe and (args.compile_only or len(args.c_files) > 1):
+        parser.error("--pipe takes a single input and cannot be combined with -c")
+    if args.compile_only and args.output and len(args.c_files) > 1:
+        parser.error("cannot specify -o with -c and multiple input files")
+    if args.pipe and args.use_async:
+        parser.error("--pipe cannot be combined with --async")
+    if args.stats_memory and args.use_async:
+        # Stages of different units overlap, and the peak is process-wide
+        parser.error("--stats-memory cannot be combined with --async")
+    if args.jobs < 1:
+        parser.error("-j must be at least 1")
+
+
+def build(
+    names: list[str],
+    cwd: str,
+    options: CompilerOptions,
+    output: str | None,
+    jobs: int,
+    err: IO[str],
+    use_async: bool = False,
+    stats: Instrumentation | None = None,
+) -> int:
+
+    # Nothing is linked unless every input compiled. Statistics of every
+    # input and of the link are added to stats.
+    if stats is None:
+        stats = Instrumentation()
+    if options.pipe:
+        try:
+            check_input(names[0], cwd)
+            cd = CompilerDriver(os.path.join(cwd, names[0]), options, err, stats)
+            cd.compile_in_memory()
+        except Exception as e:
+            report_error(names[0], e, err)
+            return 1
+        return 0
+
+    # Inputs are checked up front, and all diagnostics are reported in
+    # input order
+    results: list[tuple[Path | Exception, str, Instrumentation] | None] = []
+    for name in names:
+        try:
+            check_input(name, cwd)
+            results.append(None)
+        except DriverError as e:
+            results.append((e, "", Instrumentation()))
+    file_paths = [os.path.join(cwd, n) for n, r in zip(names, results) if r is None]
+    if use_async:
+        # Imported here because the scheduler builds on this module
+        from async_scheduler import AsyncScheduler
+
+        compiled = iter(AsyncScheduler(options, jobs).run(file_paths))
+    else:
+        compiled = iter(compile_files(file_paths, options, jobs))
+    results = [r if r is not None else next(compiled) for r in results]
+
+    status = 0
+    outputs: list[Path] = []
+    for name, (result, diagnostics, unit_stats) in zip(names, results):
+        stats.merge(unit_stats)
+        err.write(diagnostics)
+        if isinstance(result, Exception):
+            report_error(name, result, err)
+            status = 1
+        else:
+            outputs.append(result)
+
+    if options.compile_only:
+        if status == 0 and output is not None:
+            os.replace(outputs[0], output)
+    elif status == 0:
+        if output is not None:
+            executable = Path(output)
+        elif len(file_paths) == 1:
+            executable = CompilerDriver(file_paths[0], options).executable_path()
+        else:
+            executable = Path(cwd, "a.out")
+        try:
+            with stats.stage("link", subprocess=True):
+                link(outputs, executable)
+        except DriverError as e:
+            print(f"error: {e}", file=err)
+            status = 1
+
+    # Intermediate .s (or --integrated-as .o) files of a linked build
+    if not options.compile_only:
+        for output_file in outputs:
+            os.remove(output_file)
+    return status
+
+
+def main():
+    sys.exit(run(sys.argv[1:], os.getcwd(), sys.stdout, sys.stderr))
 
 
 if __name__ == "__main__":
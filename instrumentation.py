@@ -0,0 +1,148 @@
+import resource
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class StageRecord:
+    wall: float = 0.0
+    # None for sub-stages timed by the pass manager, which only reads the
+    # wall clock
+    cpu: float | None = 0.0
+    # Peak traced allocation above the stage's starting point; None unless
+    # memory tracing is on
+    peak_memory: int | None = None
+    calls: int = 0
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Instrumentation:
+    """Per-stage wall and CPU time, optional peak memory, and counters.
+
+    A stage costs a few clock reads, so this is always collected and only
+    printed on request. CPU time is the calling thread's for in-process
+    stages and that of reaped child processes for ``subprocess`` stages
+    (approximate when several gcc runs overlap, as with --async). Peak
+    memory uses tracemalloc, which slows compilation down noticeably and is
+    therefore opt-in; it is process-wide, so stages must not nest or run
+    concurrently. Tracing started here is stopped by ``stop_tracing``.
+    Sub-stages are named "<stage>.<part>" and are left out of the total.
+    """
+
+    def __init__(self, trace_memory: bool = False) -> None:
+        self.trace_memory = trace_memory
+        self.stages: dict[str, StageRecord] = {}
+        self.counts: dict[str, int] = {}
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stop_tracing(self) -> None:
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def stage(self, name: str, subprocess: bool = False) -> "Stage":
+        return Stage(self, name, subprocess)
+
+    def add(self, name: str, record: StageRecord) -> None:
+        total = self.stages.get(name)
+        if total is None:
+            self.stages[name] = StageRecord(
+                record.wall, record.cpu, record.peak_memory, record.calls
+            )
+            return
+        total.wall += record.wall
+        if record.cpu is not None:
+            total.cpu = (total.cpu or 0.0) + record.cpu
+        total.calls += record.calls
+        if record.peak_memory is not None:
+            total.peak_memory = max(total.peak_memory or 0, record.peak_memory)
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge(self, other: "Instrumentation") -> None:
+        for name, record in other.stages.items():
+            self.add(name, record)
+        for name, value in other.counts.items():
+            self.count(name, value)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {
+                name: {
+                    "wall_ms": record.wall * 1000,
+                    "cpu_ms": record.cpu * 1000 if record.cpu is not None else None,
+                    "peak_memory_bytes": record.peak_memory,
+                    "calls": record.calls,
+                }
+                for name, record in self.stages.items()
+            },
+            "counts": dict(self.counts),
+        }
+
+    def format_table(self) -> str:
+        width = max([len("stage"), *map(len, self.stages)])
+        lines = [
+            f"{'stage':<{width}}  {'wall ms':>10}  {'cpu ms':>10}  "
+            f"{'peak KiB':>10}  {'calls':>6}"
+        ]
+        wall = cpu = 0.0
+        for name, record in self.stages.items():
+            cpu_ms = f"{record.cpu * 1000:.3f}" if record.cpu is not None else "-"
+            peak = (
+                f"{record.peak_memory / 1024:.1f}"
+                if record.peak_memory is not None
+                else "-"
+            )
+            lines.append(
+                f"{name:<{width}}  {record.wall * 1000:>10.3f}  "
+                f"{cpu_ms:>10}  {peak:>10}  {record.calls:>6}"
+            )
+            if "." not in name:
+                wall += record.wall
+                cpu += record.cpu or 0.0
+        lines.append(f"{'total':<{width}}  {wall * 1000:>10.3f}  {cpu * 1000:>10.3f}")
+        for name, value in self.counts.items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Stage:
+    # Context manager timing one run of a stage; a plain class rather than
+    # a generator, since it is entered several times per unit
+    __slots__ = ("stats", "name", "cpu_clock", "start", "cpu_start", "base")
+
+    def __init__(self, stats: Instrumentation, name: str, subprocess: bool) -> None:
+        self.stats = stats
+        self.name = name
+        self.cpu_clock = children_cpu if subprocess else time.thread_time
+
+    def __enter__(self) -> None:
+        if self.stats.trace_memory:
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+        self.cpu_start = self.cpu_clock()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        wall = time.perf_counter() - self.start
+        cpu = self.cpu_clock() - self.cpu_start
+        peak = None
+        if self.stats.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - self.base
+        record = self.stats.stages.get(self.name)
+        if record is None:
+            self.stats.stages[self.name] = StageRecord(wall, cpu, peak, 1)
+            return
+        record.wall += wall
+        record.cpu += cpu
+        record.calls += 1
+        if peak is not None:
+            record.peak_memory = max(record.peak_memory or 0, peak)
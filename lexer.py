@@ -1,6 +1,10 @@
 from enum import Enum
 from pathlib import Path
+import io
 import re
+from array import array
+from collections.abc import Iterator
+from typing import TextIO
 from dataclasses import dataclass
 
 
@@ -27,74 +31,249 @@ class Token:
     value: int | None = None
 
 
+TOKEN_TYPES: list[TokenType] = list(TokenType)
+TOKEN_TYPE_INDEX: dict[TokenType, int] = {tt: i for i, tt in enumerate(TOKEN_TYPES)}
+
+
+class TokenBuffer:
+    """Struct-of-arrays token storage over a source string.
+
+    Token types, source offsets/lengths and values live in parallel typed
+    arrays. Lexemes are sliced from the source only when asked for, except
+    identifiers, which are interned once in ``identifiers`` and referenced
+    by index from ``values``. Constants that do not fit in 64 bits are kept
+    in ``big_values``.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.types = array("B")
+        self.offsets = array("q")
+        self.lengths = array("I")
+        self.values = array("q")
+        self.big_values: dict[int, int] = {}
+        self.identifiers: list[str] = []
+        self.identifier_ids: dict[str, int] = {}
+
+    def append(self, tt: TokenType, offset: int, length: int, value: int = 0) -> None:
+        if not -(1 << 63) <= value < 1 << 63:
+            self.big_values[len(self.types)] = value
+            value = 0
+        self.types.append(TOKEN_TYPE_INDEX[tt])
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.values.append(value)
+
+    def append_identifier(self, name: str, offset: int) -> None:
+        identifier_id = self.identifier_ids.get(name)
+        if identifier_id is None:
+            identifier_id = len(self.identifiers)
+            self.identifiers.append(name)
+            self.identifier_ids[name] = identifier_id
+        self.append(TokenType.IDENTIFIER, offset, len(name), identifier_id)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def tt(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+
+    def lexeme(self, index: int) -> str:
+        if self.types[index] == TOKEN_TYPE_INDEX[TokenType.IDENTIFIER]:
+            return self.identifiers[self.values[index]]
+        offset = self.offsets[index]
+        return self.source[offset : offset + self.lengths[index]]
+
+    def value(self, index: int) -> int | None:
+        if self.types[index] != TOKEN_TYPE_INDEX[TokenType.CONSTANT]:
+            return None
+        return self.big_values.get(index, self.values[index])
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return Token(self.tt(index), self.lexeme(index), self.value(index))
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self)):
+            yield self[index]
+
+
 class Lexer:
-    def __init__(self, preprocess_file: Path) -> None:
+    # Patterns are compiled once, when the module is imported, and shared by
+    # every Lexer. Keywords are lexed as identifiers and looked up in
+    # keywords.
+    identifier = re.compile(r"[a-zA-Z_]\w*\b")
+    constant = re.compile(r"[0-9]+\b")
+    two_hyphen = re.compile(r"--")
+    open_paren = re.compile(r"\(")
+    close_paren = re.compile(r"\)")
+    open_brace = re.compile(r"{")
+    close_brace = re.compile(r"}")
+    semicolon = re.compile(r";")
+    tilde = re.compile(r"~")
+    hyphen = re.compile(r"-")
+
+    whitespace = re.compile(r"\s*")
+
+    # Order matters: alternatives are tried left to right, exactly like
+    # the per-pattern loop this replaced, so "--" still wins over "-".
+    # Leading whitespace is folded into the same match so every token
+    # costs a single call into the regex engine.
+    patterns = [
+        (identifier, TokenType.IDENTIFIER),
+        (constant, TokenType.CONSTANT),
+        (two_hyphen, TokenType.TWO_HYPHEN),
+        (hyphen, TokenType.HYPHEN),
+        (tilde, TokenType.TILDE),
+        (open_paren, TokenType.OPEN_PARENTHESIS),
+        (close_paren, TokenType.CLOSE_PARENTHESIS),
+        (open_brace, TokenType.OPEN_BRACE),
+        (close_brace, TokenType.CLOSE_BRACE),
+        (semicolon, TokenType.SEMICOLON),
+    ]
+    master = re.compile(
+        whitespace.pattern
+        + "(?:"
+        + "|".join(f"(?P<{tt.name}>{pattern.pattern})" for pattern, tt in patterns)
+        + ")"
+    )
+    group_types = {tt.name: tt for _, tt in patterns}
+    keywords = {
+        "int": TokenType.INT,
+        "void": TokenType.VOID,
+        "return": TokenType.RETURN,
+    }
+
+    def __init__(
+        self,
+        preprocess_file: Path | None = None,
+        chunk_size: int = 1 << 16,
+        source: str | None = None,
+    ) -> None:
+        if (preprocess_file is None) == (source is None):
+            raise ValueError("Lexer needs exactly one of a file or a source string")
         self.preprocess_file = preprocess_file
-        self.identifier = re.compile(r"[a-zA-Z_]\w*\b")
-        self.constant = re.compile(r"[0-9]+\b")
-        self.int = re.compile("int\b")
-        self.void = re.compile("void\b")
-        self.return_ = re.compile("return\b")
-        self.two_hyphen = re.compile(r"--")
-        self.open_paren = re.compile(r"\(")
-        self.close_paren = re.compile(r"\)")
-        self.open_brace = re.compile(r"{")
-        self.close_brace = re.compile(r"}")
-        self.semicolon = re.compile(r";")
-        self.tilde = re.compile(r"~")
-        self.hyphen = re.compile(r"-")
+        self.source = source
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_source(cls, source: str, chunk_size: int = 1 << 16) -> "Lexer":
+        return cls(chunk_size=chunk_size, source=source)
+
+    def open_source(self) -> TextIO:
+        if self.source is not None:
+            return io.StringIO(self.source)
+        return open(self.preprocess_file, "r")
 
     def tokenize(self) -> list[Token]:
+        return list(self.stream())
+
+    def tokenize_compact(self) -> TokenBuffer:
 
-        with open(self.preprocess_file, "r") as f:
-            file_str = f.read()
-
-        tokens: list[Token] = []
-
-        patterns = [
-            (self.identifier, TokenType.IDENTIFIER),
-            (self.constant, TokenType.CONSTANT),
-            (self.two_hyphen, TokenType.TWO_HYPHEN),
-            (self.hyphen, TokenType.HYPHEN),
-            (self.tilde, TokenType.TILDE),
-            (self.open_paren, TokenType.OPEN_PARENTHESIS),
-            (self.close_paren, TokenType.CLOSE_PARENTHESIS),
-            (self.open_brace, TokenType.OPEN_BRACE),
-            (self.close_brace, TokenType.CLOSE_BRACE),
-            (self.semicolon, TokenType.SEMICOLON),
-        ]
+        # The buffer slices lexemes out of the source, so a source string is
+        # used as it is rather than copied through open_source
+        if self.source is not None:
+            file_str = self.source
+        else:
+            with self.open_source() as f:
+                file_str = f.read()
+
+        tokens = TokenBuffer(file_str)
+        match = self.master.match
+        keywords = self.keywords
+        group_types = self.group_types
+        end = len(file_str)
         pos = 0
-        while pos < len(file_str):
-
-            while pos < len(file_str) and file_str[pos].isspace():
-                pos += 1
-
-            if pos >= len(file_str):
-                break
-
-            matched = False
-            for pattern, tt in patterns:
-                m = pattern.match(file_str, pos)
-                if m:
-                    lexeme = m.group()
-                    if tt == TokenType.TWO_HYPHEN:
-                        raise ValueError(
-                            f"Cannot support two_hyphen yet at '{file_str[pos]}' at position {pos}"
-                        )
-                    if tt == TokenType.IDENTIFIER:
-                        if lexeme == "int":
-                            tt = TokenType.INT
-                        elif lexeme == "void":
-                            tt = TokenType.VOID
-                        elif lexeme == "return":
-                            tt = TokenType.RETURN
-                    value = int(lexeme) if tt == TokenType.CONSTANT else None
-                    tokens.append(Token(tt, lexeme, value))
-                    pos = m.end()
-                    matched = True
+        while pos < end:
+            m = match(file_str, pos)
+            if m is None:
+                pos = self.whitespace.match(file_str, pos).end()
+                if pos >= end:
                     break
-            if not matched:
                 raise ValueError(
                     f"Unexpected character '{file_str[pos]}' at position {pos}"
                 )
+            kind = m.lastgroup
+            start = m.start(kind)
+            if kind == "TWO_HYPHEN":
+                raise ValueError(
+                    f"Cannot support two_hyphen yet at '{file_str[start]}' at position {start}"
+                )
+            pos = m.end()
+            if kind == "IDENTIFIER":
+                lexeme = m.group(kind)
+                keyword = keywords.get(lexeme)
+                if keyword is None:
+                    tokens.append_identifier(lexeme, start)
+                else:
+                    tokens.append(keyword, start, pos - start)
+            elif kind == "CONSTANT":
+                tokens.append(TokenType.CONSTANT, start, pos - start, int(m.group(kind)))
+            else:
+                tokens.append(group_types[kind], start, pos - start)
         return tokens
+
+    def stream(self) -> Iterator[Token]:
+        """Yield tokens while reading the source in chunks of ``chunk_size``.
+
+        Only the unconsumed tail of the current chunk is kept, so memory
+        stays bounded by the chunk size and the longest token. Positions in
+        error messages are absolute offsets into the file, as if it had been
+        read in one go.
+        """
+        match = self.master.match
+        skip_whitespace = self.whitespace.match
+        keywords = self.keywords
+        group_types = self.group_types
+
+        with self.open_source() as f:
+            buf = f.read(self.chunk_size)
+            eof = len(buf) < self.chunk_size
+            base = 0
+            pos = 0
+            while True:
+                end = len(buf)
+                # Whitespace is dropped before refilling, so only a partial
+                # token is ever carried over into the next buffer
+                pos = skip_whitespace(buf, pos).end()
+                if pos == end:
+                    if eof:
+                        return
+                    buf = f.read(self.chunk_size)
+                    eof = len(buf) < self.chunk_size
+                    base += end
+                    pos = 0
+                    continue
+                m = match(buf, pos)
+                # A match that runs into the end of the buffer may continue
+                # in the next chunk ("-" vs "--", a split identifier). Reading
+                # at least as much as is carried over keeps long tokens linear.
+                if m is not None and m.end() == end and not eof:
+                    size = max(self.chunk_size, end - pos)
+                    chunk = f.read(size)
+                    eof = len(chunk) < size
+                    base += pos
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                if m is None:
+                    raise ValueError(
+                        f"Unexpected character '{buf[pos]}' at position {base + pos}"
+                    )
+                kind = m.lastgroup
+                if kind == "TWO_HYPHEN":
+                    pos = m.start(kind)
+                    raise ValueError(
+                        f"Cannot support two_hyphen yet at '{buf[pos]}' at position {base + pos}"
+                    )
+                lexeme = m.group(kind)
+                if kind == "IDENTIFIER":
+                    yield Token(keywords.get(lexeme, TokenType.IDENTIFIER), lexeme)
+                elif kind == "CONSTANT":
+                    yield Token(TokenType.CONSTANT, lexeme, int(lexeme))
+                else:
+                    yield Token(group_types[kind], lexeme)
+                pos = m.end()
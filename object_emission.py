@@ -0,0 +1,266 @@
+import struct
+from typing import IO
+from assembly_generator import (
+    AllocateStack,
+    AssemblyProgram,
+    AssemblyInstruction,
+    AssemblyOperand,
+    ImmediateValue,
+    Mov,
+    Neg,
+    Not,
+    Reg,
+    Register,
+    Ret,
+    Stack,
+    Unary,
+)
+from dispatch import TypeDispatch
+
+
+# Hardware register numbers; 8 and up need a REX prefix bit
+REGISTER_NUMBERS: dict[Register, int] = {
+    Register.EAX: 0,
+    Register.ECX: 1,
+    Register.EDX: 2,
+    Register.ESI: 6,
+    Register.EDI: 7,
+    Register.R8: 8,
+    Register.R9: 9,
+    Register.R10: 10,
+    Register.R11: 11,
+}
+
+# Opcode extension (ModRM reg field) of the 0xF7 group
+UNARY_EXTENSIONS: dict[type, int] = {
+    Neg: 3,
+    Not: 2,
+}
+
+RBP = 5
+
+PROLOGUE = bytes([0x55, 0x48, 0x89, 0xE5])  # pushq %rbp; movq %rsp, %rbp
+EPILOGUE = bytes([0x48, 0x89, 0xEC, 0x5D, 0xC3])  # movq %rbp, %rsp; popq %rbp; ret
+
+# ELF constants used by the object writer
+ELF_HEADER = struct.Struct("<16sHHIQQQIHHHHHH")
+SECTION_HEADER = struct.Struct("<IIQQQQIIQQ")
+SYMBOL = struct.Struct("<IBBHQQ")
+ET_REL = 1
+EM_X86_64 = 62
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_NOTYPE = 0
+STT_SECTION = 3
+
+# Section header table order; index 0 is the null section
+SECTION_NAMES = [".text", ".note.GNU-stack", ".symtab", ".strtab", ".shstrtab"]
+
+
+def encode_immediate(value: int) -> bytes:
+    # Wider values keep their low 32 bits, as gas shortens them
+    return struct.pack("<I", value & 0xFFFFFFFF)
+
+
+def rm_encoding(operand: AssemblyOperand) -> tuple[int, int, bytes]:
+    # (REX bits, ModRM byte without the reg field, displacement) addressing
+    # a register or an %rbp-relative stack slot through the r/m field
+    if type(operand) is Reg:
+        number = REGISTER_NUMBERS[operand.register]
+        return (0x01 if number & 8 else 0), 0xC0 | number & 7, b""
+    if type(operand) is Stack:
+        if -128 <= operand.val <= 127:
+            return 0, 0x40 | RBP, struct.pack("<b", operand.val)
+        return 0, 0x80 | RBP, struct.pack("<i", operand.val)
+    raise ValueError(f"Cannot encode operand: {operand}")
+
+
+REGISTER_ENCODINGS: dict[Reg, tuple[int, int, bytes]] = {
+    Reg(register): rm_encoding(Reg(register)) for register in REGISTER_NUMBERS
+}
+
+
+def align(offset: int, alignment: int) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def section_header(
+    name: int,
+    section_type: int,
+    offset: int,
+    size: int,
+    flags: int = 0,
+    link: int = 0,
+    info: int = 0,
+    alignment: int = 1,
+    entsize: int = 0,
+) -> bytes:
+    return SECTION_HEADER.pack(
+        name, section_type, flags, 0, offset, size, link, info, alignment, entsize
+    )
+
+
+class ObjectEmitter:
+    def __init__(self, assembly_ast: AssemblyProgram) -> None:
+        self.assembly_ast: AssemblyProgram = assembly_ast
+        # Encodings by operand, seeded with every register; stack slots are
+        # added as they are first seen, as in AssemblyEmitter.operand_strings
+        self.operand_encodings: dict[AssemblyOperand, tuple[int, int, bytes]] = dict(
+            REGISTER_ENCODINGS
+        )
+
+    def emit(self) -> bytes:
+        return self.elf_object(self.encode())
+
+    def emit_to(self, stream: IO[bytes]) -> int:
+        return stream.write(self.emit())
+
+    def encode(self) -> bytes:
+        func = self.assembly_ast.function_definition
+        code = bytearray(PROLOGUE)
+        resolve = self.instruction_encoders.resolve
+        for instr in func.instructions:
+            code += resolve(type(instr))(self, instr)
+        return bytes(code)
+
+    instruction_encoders = TypeDispatch("Unknown instruction type: {name}")
+
+    def encode_instruction(self, instr: AssemblyInstruction) -> bytes:
+        return self.instruction_encoders(self, instr)
+
+    def encode_modrm(self, opcode: int, reg: int, rm: AssemblyOperand) -> bytes:
+        # opcode and ModRM byte, whose reg field holds a register number or
+        # opcode extension, preceded by the REX prefix the registers need
+        encoding = self.operand_encodings.get(rm)
+        if encoding is None:
+            encoding = self.operand_encodings[rm] = rm_encoding(rm)
+        rex, modrm, displacement = encoding
+        if reg & 8:
+            rex |= 0x04
+        modrm |= (reg & 7) << 3
+        if rex:
+            return bytes([0x40 | rex, opcode, modrm]) + displacement
+        return bytes([opcode, modrm]) + displacement
+
+    @instruction_encoders.register(Mov)
+    def encode_mov(self, instr: Mov) -> bytes:
+        src, dst = instr.src, instr.dst
+        if type(src) is ImmediateValue:
+            if type(dst) is Reg:
+                number = REGISTER_NUMBERS[dst.register]
+                opcode = bytes([0xB8 + (number & 7)])
+                prefix = b"\x41" if number & 8 else b""
+                return prefix + opcode + encode_immediate(src.value)
+            if type(dst) is Stack:
+                return self.encode_modrm(0xC7, 0, dst) + encode_immediate(src.value)
+        elif type(src) is Reg and type(dst) in (Reg, Stack):
+            return self.encode_modrm(0x89, REGISTER_NUMBERS[src.register], dst)
+        elif type(src) is Stack and type(dst) is Reg:
+            return self.encode_modrm(0x8B, REGISTER_NUMBERS[dst.register], src)
+        raise ValueError(f"Cannot encode movl {src}, {dst}")
+
+    @instruction_encoders.register(Unary)
+    def encode_unary(self, instr: Unary) -> bytes:
+        extension = UNARY_EXTENSIONS.get(type(instr.unary_operator))
+        if extension is None:
+            raise ValueError(
+                f"Unknown operand type: {type(instr.unary_operator).__name__}"
+            )
+        return self.encode_modrm(0xF7, extension, instr.operand)
+
+    @instruction_encoders.register(AllocateStack)
+    def encode_allocate_stack(self, instr: AllocateStack) -> bytes:
+        # subq $val, %rsp
+        if -128 <= instr.val <= 127:
+            return b"\x48\x83\xec" + struct.pack("<b", instr.val)
+        return b"\x48\x81\xec" + encode_immediate(instr.val)
+
+    @instruction_encoders.register(Ret)
+    def encode_ret(self, instr: Ret) -> bytes:
+        return EPILOGUE
+
+    def elf_object(self, code: bytes) -> bytes:
+        # Relocatable ELF64 with .text, an empty .note.GNU-stack (so the
+        # linker keeps the stack non-executable), and the symbol tables.
+        name = self.assembly_ast.function_definition.name
+        strtab = b"\0" + name.encode() + b"\0"
+        symtab = b"".join(
+            [
+                SYMBOL.pack(0, 0, 0, 0, 0, 0),
+                SYMBOL.pack(0, STB_LOCAL << 4 | STT_SECTION, 0, 1, 0, 0),
+                SYMBOL.pack(1, STB_GLOBAL << 4 | STT_NOTYPE, 0, 1, 0, 0),
+            ]
+        )
+        shstrtab = b"\0"
+        name_offsets: dict[str, int] = {}
+        for section_name in SECTION_NAMES:
+            name_offsets[section_name] = len(shstrtab)
+            shstrtab += section_name.encode() + b"\0"
+
+        text_offset = ELF_HEADER.size
+        symtab_offset = align(text_offset + len(code), 8)
+        strtab_offset = symtab_offset + len(symtab)
+        shstrtab_offset = strtab_offset + len(strtab)
+        section_offset = align(shstrtab_offset + len(shstrtab), 8)
+
+        sections = [
+            SECTION_HEADER.pack(0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+            section_header(
+                name_offsets[".text"],
+                SHT_PROGBITS,
+                text_offset,
+                len(code),
+                flags=SHF_ALLOC | SHF_EXECINSTR,
+            ),
+            section_header(
+                name_offsets[".note.GNU-stack"], SHT_PROGBITS, symtab_offset, 0
+            ),
+            # sh_link is the string table, sh_info the first global symbol
+            section_header(
+                name_offsets[".symtab"],
+                SHT_SYMTAB,
+                symtab_offset,
+                len(symtab),
+                link=SECTION_NAMES.index(".strtab") + 1,
+                info=2,
+                alignment=8,
+                entsize=SYMBOL.size,
+            ),
+            section_header(
+                name_offsets[".strtab"], SHT_STRTAB, strtab_offset, len(strtab)
+            ),
+            section_header(
+                name_offsets[".shstrtab"], SHT_STRTAB, shstrtab_offset, len(shstrtab)
+            ),
+        ]
+
+        ident = b"\x7fELF" + bytes([2, 1, 1, 0])
+        header = ELF_HEADER.pack(
+            ident,
+            ET_REL,
+            EM_X86_64,
+            1,  # e_version
+            0,  # e_entry
+            0,  # e_phoff
+            section_offset,
+            0,  # e_flags
+            ELF_HEADER.size,
+            0,  # e_phentsize
+            0,  # e_phnum
+            SECTION_HEADER.size,
+            len(sections),
+            SECTION_NAMES.index(".shstrtab") + 1,
+        )
+
+        image = bytearray(header)
+        image += code
+        image += bytes(symtab_offset - len(image))
+        image += symtab + strtab + shstrtab
+        image += bytes(section_offset - len(image))
+        image += b"".join(sections)
+        return bytes(image)
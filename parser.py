@@ -1,69 +1,89 @@
 from dataclasses import dataclass
 from abc import ABC
+from collections import deque
+from collections.abc import Iterable
 from lexer import Token, TokenType
 
 
 class Statement(ABC):
-    pass
+    __slots__ = ()
 
 
 class Expression(ABC):
-    pass
+    __slots__ = ()
 
 
 class UnaryOperator(ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class Program:
     function_definition: "Function"
 
 
-@dataclass
+@dataclass(slots=True)
 class Function:
     name: str
     body: "Statement"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Return(Statement):
     exp: "Expression"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Constant(Expression):
     value: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Unary(Expression):
     unary_operator: UnaryOperator
     exp: "Expression"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Complement(UnaryOperator):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Negate(UnaryOperator):
     pass
 
 
+# Stateless operators are shared singletons
+COMPLEMENT = Complement()
+NEGATE = Negate()
+
+
 class Parser:
-    def __init__(self, tokens: list[Token]) -> None:
-        self.tokens = tokens
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        # Tokens are pulled lazily through a small lookahead buffer, so the
+        # parser works the same on a list or on Lexer.stream().
+        self.tokens = iter(tokens)
+        self.lookahead: deque[Token] = deque()
         self.index = 0
+        # AST nodes built so far, for statistics
+        self.nodes = 0
+
+    def fill(self, count: int = 1) -> bool:
+        while len(self.lookahead) < count:
+            token = next(self.tokens, None)
+            if token is None:
+                return False
+            self.lookahead.append(token)
+        return True
 
     def peek(self) -> Token:
-        if self.index >= len(self.tokens):
+        if not self.fill():
             raise SyntaxError("Unexpected end of input")
-        return self.tokens[self.index]
+        return self.lookahead[0]
 
     def consume(self, expected_type):
-        if self.index >= len(self.tokens):
+        if not self.fill():
             raise SyntaxError("Unexpected end of input")
 
         token: Token = self.peek()
@@ -72,18 +92,20 @@ class Parser:
                 f"Expected {expected_type}, found {token.tt.value} "
                 f"('{token.lexeme}') at position {self.index}"
             )
+        self.lookahead.popleft()
         self.index += 1
         return token
 
     def parse_program(self):
 
         func: Function = self.parse_function()
-        if self.index < len(self.tokens):
-            unexpected = self.tokens[self.index]
+        if self.fill():
+            unexpected = self.lookahead[0]
             raise SyntaxError(
                 f"Unexpected token {unexpected.tt.value} ('{unexpected.lexeme}') "
                 f"after end of program"
             )
+        self.nodes += 1
         return Program(func)
 
     def parse_function(self) -> Function:
@@ -96,47 +118,67 @@ class Parser:
         self.consume(TokenType.OPEN_BRACE)
         statement: Statement = self.parse_statement()
         self.consume(TokenType.CLOSE_BRACE)
+        self.nodes += 1
         return Function(name, statement)
 
     def parse_statement(self) -> Statement:
         self.consume(TokenType.RETURN)
         expr: Expression = self.parse_expression()
         self.consume(TokenType.SEMICOLON)
+        self.nodes += 1
         return Return(expr)
 
     def parse_expression(self):
+        # Explicit-stack expression parser: prefix operators and open
+        # parentheses are pushed as pending frames instead of recursing, so
+        # nesting depth is bounded by memory rather than the recursion limit.
+        # A frame of None marks an open parenthesis. Binary operators will
+        # slot in after an operand is complete, reducing pending frames
+        # whose precedence is at least their own before pushing themselves.
+        pending: list[UnaryOperator | None] = []
+        while True:
+            token: Token = self.peek()
+            if token.tt in (TokenType.HYPHEN, TokenType.TILDE):
+                pending.append(self.parse_unary_operator())
+            elif token.tt == TokenType.OPEN_PARENTHESIS:
+                self.consume(TokenType.OPEN_PARENTHESIS)
+                pending.append(None)
+            else:
+                break
+
+        expr: Expression = self.parse_constant()
+
+        while pending:
+            operator = pending.pop()
+            if operator is None:
+                self.consume(TokenType.CLOSE_PARENTHESIS)
+            else:
+                expr = Unary(operator, expr)
+                self.nodes += 1
+        return expr
+
+    def parse_constant(self) -> Constant:
         token: Token = self.peek()
-        if token.tt == TokenType.CONSTANT:
-            token = self.consume(TokenType.CONSTANT)
-            if token.value is None:
-                raise SyntaxError(
-                    f"Internal error: CONSTANT token at position {self.index} has no value"
-                )
-            return Constant(token.value)
-
-        elif token.tt in (TokenType.HYPHEN, TokenType.TILDE):
-            operator: UnaryOperator = self.parse_unary_operator()
-            inner_expr = self.parse_expression()
-            return Unary(operator, inner_expr)
-
-        elif token.tt == TokenType.OPEN_PARENTHESIS:
-            self.consume(TokenType.OPEN_PARENTHESIS)
-            inner_expr = self.parse_expression()
-            self.consume(TokenType.CLOSE_PARENTHESIS)
-            return inner_expr
-        else:
+        if token.tt != TokenType.CONSTANT:
             raise SyntaxError(
                 f"Expected expression, found {token.tt.value} "
                 f"('{token.lexeme}') at position {self.index}"
             )
+        token = self.consume(TokenType.CONSTANT)
+        if token.value is None:
+            raise SyntaxError(
+                f"Internal error: CONSTANT token at position {self.index} has no value"
+            )
+        self.nodes += 1
+        return Constant(token.value)
 
     def parse_unary_operator(self) -> UnaryOperator:
         token = self.peek()
         if token.tt == TokenType.TILDE:
             self.consume(TokenType.TILDE)
-            return Complement()
+            return COMPLEMENT
         elif token.tt == TokenType.HYPHEN:
             self.consume(TokenType.HYPHEN)
-            return Negate()
+            return NEGATE
         else:
             raise SyntaxError(f"Expected unary operator, found {token.tt.value}")
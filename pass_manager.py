@@ -0,0 +1,81 @@
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+
+@dataclass
+class Pass:
+    name: str
+    # Instruction passes map one instruction to a list of replacements and
+    # can be fused with their neighbours; function passes see the whole list.
+    run: Callable
+    per_instruction: bool = True
+    requires: tuple[str, ...] = ()
+
+
+class PassManager:
+    def __init__(self, passes: list[Pass], fuse: bool = True, timed: bool = False):
+        seen: set[str] = set()
+        for p in passes:
+            missing = [name for name in p.requires if name not in seen]
+            if missing:
+                raise ValueError(
+                    f"Pass '{p.name}' must run after: {', '.join(missing)}"
+                )
+            seen.add(p.name)
+        self.passes = passes
+        self.fuse = fuse
+        self.timed = timed
+        self.timings: dict[str, float] = {p.name: 0.0 for p in passes}
+
+    def groups(self) -> list[list[Pass]]:
+        # Consecutive instruction passes form one fused traversal
+        groups: list[list[Pass]] = []
+        for p in self.passes:
+            if (
+                self.fuse
+                and p.per_instruction
+                and groups
+                and groups[-1][-1].per_instruction
+            ):
+                groups[-1].append(p)
+            else:
+                groups.append([p])
+        return groups
+
+    def run(self, items: list) -> list:
+        for group in self.groups():
+            if group[0].per_instruction:
+                items = self.run_fused(group, items)
+            else:
+                items = self.call(group[0], items)
+        return items
+
+    def run_fused(self, group: list[Pass], items: list) -> list:
+        # Push each input instruction through the whole chain before moving
+        # on, so no intermediate list of the full function is built.
+        if self.timed:
+            runs = [lambda x, p=p: self.call(p, x) for p in group]
+        else:
+            runs = [p.run for p in group]
+        output: list = []
+        for item in items:
+            current = [item]
+            for run in runs:
+                if len(current) == 1:
+                    current = run(current[0])
+                else:
+                    expanded = []
+                    for instruction in current:
+                        expanded.extend(run(instruction))
+                    current = expanded
+            output.extend(current)
+        return output
+
+    def call(self, p: Pass, argument):
+        if not self.timed:
+            return p.run(argument)
+        start = time.perf_counter()
+        result = p.run(argument)
+        self.timings[p.name] += time.perf_counter() - start
+        return result
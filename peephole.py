@@ -0,0 +1,200 @@
+from collections.abc import Callable
+from assembly_generator import (
+    AssemblyProgram,
+    AssemblyFunction,
+    AssemblyInstruction,
+    AssemblyOperand,
+    AllocateStack,
+    Mov,
+    Unary,
+    Ret,
+    Neg,
+    Not,
+    ImmediateValue,
+    Reg,
+    Register,
+    Stack,
+    EAX,
+    R10,
+)
+from dispatch import TypeDispatch
+from tacky_optimizer import wrap_int32
+
+
+# A rule looks at a window of consecutive instructions and returns their
+# replacement, or None when it does not apply. Rules keep match statements:
+# they test the shape of several instructions at once, with guards, which a
+# table keyed by one node type cannot express.
+PeepholeRule = Callable[[list[AssemblyInstruction]], list[AssemblyInstruction] | None]
+
+PEEPHOLE_RULES: list[tuple[str, int, PeepholeRule]] = []
+
+
+def peephole_rule(window: int):
+    def register(rule: PeepholeRule) -> PeepholeRule:
+        PEEPHOLE_RULES.append((rule.__name__, window, rule))
+        return rule
+
+    return register
+
+
+def is_memory(operand: AssemblyOperand) -> bool:
+    return isinstance(operand, Stack)
+
+
+# Whether an instruction reads the given operand
+reads = TypeDispatch("Unknown instruction type: {name}", arg=0)
+reads.register(Mov)(lambda instruction, operand: instruction.src == operand)
+reads.register(Unary)(lambda instruction, operand: instruction.operand == operand)
+reads.register(Ret)(lambda instruction, operand: operand == EAX)
+reads.register(AssemblyInstruction)(lambda instruction, operand: False)
+
+instruction_operands = TypeDispatch("Unknown instruction type: {name}", arg=0)
+instruction_operands.register(Mov)(
+    lambda instruction: [instruction.src, instruction.dst]
+)
+instruction_operands.register(Unary)(lambda instruction: [instruction.operand])
+instruction_operands.register(AssemblyInstruction)(lambda instruction: [])
+
+
+@peephole_rule(window=1)
+def self_move(window):
+    # movl x, x
+    match window:
+        case [Mov(src, dst)] if src == dst:
+            return []
+    return None
+
+
+@peephole_rule(window=2)
+def fold_immediate_unary(window):
+    # movl $c, d; negl/notl d  ->  movl $(-c / ~c), d
+    match window:
+        case [Mov(ImmediateValue(value), dst), Unary(Neg(), target)] if dst == target:
+            return [Mov(ImmediateValue(wrap_int32(-value)), dst)]
+        case [Mov(ImmediateValue(value), dst), Unary(Not(), target)] if dst == target:
+            return [Mov(ImmediateValue(wrap_int32(~value)), dst)]
+    return None
+
+
+@peephole_rule(window=2)
+def scratch_round_trip(window):
+    # movl S, %r10d; movl %r10d, S  (from fix_mov_double_address) cancels out
+    match window:
+        case [Mov(src, Reg(Register.R10)), Mov(Reg(Register.R10), dst)] if src == dst:
+            return []
+    return None
+
+
+@peephole_rule(window=2)
+def move_back(window):
+    # movl a, b; movl b, a  ->  movl a, b
+    match window:
+        case [Mov(a, b) as first, Mov(c, d)] if a == d and b == c:
+            return [first]
+    return None
+
+
+@peephole_rule(window=2)
+def store_reload(window):
+    # movl x, S; movl S, y  ->  movl x, S; movl x, y  (unless both memory)
+    match window:
+        case [Mov(x, s) as store, Mov(t, y)] if s == t and x != s:
+            if is_memory(x) and is_memory(y):
+                return None
+            return [store, Mov(x, y)]
+    return None
+
+
+@peephole_rule(window=2)
+def dead_scratch(window):
+    # %r10d is only ever read by the instruction right after it is written,
+    # so a write to it that the next instruction does not read is dead.
+    match window:
+        case [Mov(_, Reg(Register.R10)), following] if not reads(
+            following, R10
+        ):
+            return [following]
+    return None
+
+
+@peephole_rule(window=2)
+def overwritten_store(window):
+    # movl x, S; movl y, S  ->  movl y, S
+    match window:
+        case [Mov(_, s), Mov(y, t) as second] if s == t and y != s:
+            return [second]
+    return None
+
+
+@peephole_rule(window=3)
+def dead_store_before_return(window):
+    # Pseudos are local to the function, so any location other than %eax
+    # that is written just before the return value is loaded, and not read
+    # by that load, is dead.
+    match window:
+        case [Mov(_, s), Mov(y, t) as load, Ret() as ret] if s != EAX and t == EAX:
+            if y != s:
+                return [load, ret]
+    return None
+
+
+@peephole_rule(window=2)
+def dead_store_at_return(window):
+    # movl x, S; ret  ->  ret
+    match window:
+        case [Mov(_, s), Ret() as ret] if s != EAX:
+            return [ret]
+    return None
+
+
+class PeepholeOptimizer:
+    def __init__(self, assembly_program: AssemblyProgram) -> None:
+        self.assembly_program = assembly_program
+        self.rules = PEEPHOLE_RULES
+        self.rule_counts: dict[str, int] = {name: 0 for name, _, _ in self.rules}
+        self.rule_counts["unused_frame"] = 0
+
+    def optimize(self) -> AssemblyProgram:
+
+        func = self.assembly_program.function_definition
+        instructions = self.rewrite(list(func.instructions))
+        instructions = self.drop_unused_frame(instructions)
+        return AssemblyProgram(AssemblyFunction(func.name, instructions))
+
+    def rewrite(
+        self, instructions: list[AssemblyInstruction]
+    ) -> list[AssemblyInstruction]:
+        # Instructions are moved one at a time from a pending stack onto the
+        # output, and every window ending at the newly added instruction is
+        # tried. A replacement goes back onto the pending stack, so windows
+        # overlapping it are tried again; rewriting stays linear overall.
+        output: list[AssemblyInstruction] = []
+        pending = list(reversed(instructions))
+        while pending:
+            output.append(pending.pop())
+            for name, window, rule in self.rules:
+                if len(output) < window:
+                    continue
+                replacement = rule(output[-window:])
+                if replacement is not None:
+                    del output[-window:]
+                    pending.extend(reversed(replacement))
+                    self.rule_counts[name] += 1
+                    break
+        return output
+
+    def drop_unused_frame(
+        self, instructions: list[AssemblyInstruction]
+    ) -> list[AssemblyInstruction]:
+        uses_stack = any(
+            is_memory(operand)
+            for instruction in instructions
+            for operand in instruction_operands(instruction)
+        )
+        if uses_stack:
+            return instructions
+        kept = [i for i in instructions if not isinstance(i, AllocateStack)]
+        self.rule_counts["unused_frame"] += len(instructions) - len(kept)
+        return kept
+
@@ -0,0 +1,93 @@
+from collections.abc import Iterable
+from typing import IO
+from lexer import Token
+from parser import Parser, Program
+from tacky import TackyGenerator, TackyProgram
+from tacky_optimizer import TackyOptimizer
+from register_allocator import RegisterAllocator
+from assembly_generator import AssemblyGenerator, AssemblyProgram
+from peephole import PeepholeOptimizer
+from instrumentation import Instrumentation, StageRecord
+
+
+# The compilation stages after lexing, shared by the driver and the library
+# API so that both run the same passes in the same order
+
+
+def parse_tokens(
+    tokens: Iterable[Token], stats: Instrumentation | None = None
+) -> Program:
+    stats = stats if stats is not None else Instrumentation()
+
+    # Parser which turns the token stream into a AST. Tokens are lexed
+    # as the parser asks for them, so the two are timed together.
+    p = Parser(tokens)
+    with stats.stage("lex+parse"):
+        ast: Program = p.parse_program()
+    stats.count("tokens", p.index)
+    stats.count("ast_nodes", p.nodes)
+    return ast
+
+
+def lower_program(
+    ast: Program,
+    stats: Instrumentation | None = None,
+    opt_level: int = 0,
+    asm_passes: list[str] | None = None,
+    time_passes: bool = False,
+    report: IO[str] | None = None,
+    stop: str = "assembly",
+) -> TackyProgram | AssemblyProgram:
+
+    # From the AST to the final assembly AST, or to TACKY with stop="tacky".
+    # Optimizer counts are printed to report, if given.
+    stats = stats if stats is not None else Instrumentation()
+
+    # IR three-address code (TAC) pass
+    tg = TackyGenerator(ast)
+    with stats.stage("tacky"):
+        tacky_program: TackyProgram = tg.generate_tacky_ir()
+
+    # Optimization pass over TACKY (-O1)
+    if opt_level >= 1:
+        to = TackyOptimizer(tacky_program)
+        with stats.stage("tacky-opt"):
+            tacky_program = to.optimize()
+        if report is not None:
+            for name, count in to.stats.items():
+                print(f"{name}: {count}", file=report)
+    if stop == "tacky":
+        return tacky_program
+
+    # Assembly generation pass : Convert the Tacky into assembly AST
+    # Register allocation replaces stack-only pseudo replacement at -O1
+    allocator = RegisterAllocator() if opt_level >= 1 else None
+    ag: AssemblyGenerator = AssemblyGenerator(
+        tacky_program,
+        allocator,
+        pass_names=asm_passes,
+        time_passes=time_passes,
+    )
+    stats.count("tacky_instructions", len(tacky_program.function_definition.body))
+    with stats.stage("codegen"):
+        assembly_ast: AssemblyProgram = ag.generate_assembly_ast()
+    if time_passes:
+        for name, seconds in ag.pass_manager.timings.items():
+            stats.add(f"codegen.{name}", StageRecord(seconds, None, None, 1))
+    stats.count("pseudos", len(ag.pseudos))
+    stats.count("stack_bytes", max(0, -ag.current_offset))
+
+    # Peephole pass over the final instruction list (-O1)
+    if opt_level >= 1:
+        po = PeepholeOptimizer(assembly_ast)
+        with stats.stage("peephole"):
+            assembly_ast = po.optimize()
+        if report is not None:
+            for name, count in po.rule_counts.items():
+                print(f"peephole.{name}: {count}", file=report)
+    stats.count(
+        "assembly_instructions",
+        len(assembly_ast.function_definition.instructions),
+    )
+
+    return assembly_ast
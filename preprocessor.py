@@ -0,0 +1,146 @@
+import re
+from pathlib import Path
+
+
+class UnsupportedConstruct(ValueError):
+    """Raised for input the in-process preprocessor leaves to gcc -E."""
+
+
+# Comments, plus string and character literals so that comment markers
+# inside them are not mistaken for comments
+COMMENT = re.compile(
+    r"""//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'""", re.DOTALL
+)
+DIRECTIVE = re.compile(r"\s*#\s*(\w*)(.*)")
+DEFINE = re.compile(r"\s*([A-Za-z_]\w*)(.*)")
+INCLUDE = re.compile(r'\s*"([^"]+)"\s*')
+# Identifiers, and pp-numbers so that digits inside them are left alone
+WORD = re.compile(r"[A-Za-z_]\w*|[0-9][\w.]*")
+
+# gcc predefines these (and many names starting with "__")
+PREDEFINED = {"linux", "unix"}
+
+MAX_INCLUDE_DEPTH = 200
+
+
+class Preprocessor:
+    def __init__(self, include_paths: list[Path] | None = None) -> None:
+        self.include_paths = [Path(p) for p in include_paths or []]
+        self.macros: dict[str, str] = {}
+
+    def preprocess_file(self, path: Path) -> str:
+        # Same tokens as gcc -E -P for comments, line splicing, object-like
+        # #define/#undef and quoted #include; anything else raises
+        # UnsupportedConstruct so the caller can fall back to gcc.
+        lines: list[str] = []
+        self.include(Path(path), lines, 0)
+        return "".join(line + "\n" for line in lines)
+
+    def preprocess_source(self, text: str, directory: Path | None = None) -> str:
+        # Like preprocess_file for source text that is not in a file. Quoted
+        # includes are looked up in directory, if given, and then in the
+        # include paths.
+        lines: list[str] = []
+        self.process(text, "<source>", directory, lines, 0)
+        return "".join(line + "\n" for line in lines)
+
+    def include(self, path: Path, lines: list[str], depth: int) -> None:
+        if depth > MAX_INCLUDE_DEPTH:
+            raise UnsupportedConstruct(f"#include nested too deeply in {path}")
+        try:
+            text = path.read_text()
+        except (OSError, UnicodeDecodeError) as e:
+            raise UnsupportedConstruct(str(e)) from e
+        self.process(text, str(path), path.parent, lines, depth)
+
+    def process(
+        self,
+        text: str,
+        source_name: str,
+        directory: Path | None,
+        lines: list[str],
+        depth: int,
+    ) -> None:
+        text = COMMENT.sub(self.strip_comment, text.replace("\\\n", ""))
+        if "/*" in text:
+            raise UnsupportedConstruct(f"Unterminated comment in {source_name}")
+
+        for line in text.split("\n"):
+            directive = DIRECTIVE.match(line)
+            if directive is None:
+                if '"' in line or "'" in line:
+                    raise UnsupportedConstruct("String and character literals")
+                if line.strip():
+                    lines.append(self.expand(line))
+                continue
+            name, rest = directive.groups()
+            if name == "define":
+                self.define(rest)
+            elif name == "undef":
+                self.macros.pop(rest.strip(), None)
+            elif name == "include":
+                self.include(self.find_include(rest, directory), lines, depth + 1)
+            elif name or rest.strip():
+                raise UnsupportedConstruct(f"Unsupported directive #{name}")
+
+    def strip_comment(self, match: re.Match) -> str:
+        text = match.group()
+        return text if text[0] in "\"'" else " "
+
+    def define(self, rest: str) -> None:
+        definition = DEFINE.match(rest)
+        if definition is None:
+            raise UnsupportedConstruct(f"Malformed #define{rest}")
+        name, body = definition.groups()
+        if body.startswith("(") or "#" in body:
+            raise UnsupportedConstruct(f"Function-like or token-pasting macro {name}")
+        self.macros[name] = body.strip()
+
+    def find_include(self, rest: str, directory: Path | None) -> Path:
+        include = INCLUDE.fullmatch(rest)
+        if include is None:
+            raise UnsupportedConstruct(f"Unsupported #include{rest}")
+        name = include.group(1)
+        search = self.include_paths
+        if directory is not None:
+            search = [directory, *search]
+        for path in search:
+            candidate = path / name
+            if candidate.is_file():
+                return candidate
+        raise UnsupportedConstruct(f"Include file not found: {name}")
+
+    def expand(self, text: str) -> str:
+        # A macro is not expanded again inside its own expansion. Expansions
+        # are padded with spaces so they never paste onto neighbouring
+        # tokens ("-X" with X "-1" must not become "--1"). Nested expansions
+        # go on an explicit stack of (text, position, macro) frames, so long
+        # chains of macros defined in terms of each other cannot overflow
+        # the Python stack.
+        output: list[str] = []
+        disabled: set[str] = set()
+        stack: list[tuple[str, int, str | None]] = [(text, 0, None)]
+        while stack:
+            text, position, macro = stack.pop()
+            match = WORD.search(text, position)
+            if match is None:
+                output.append(text[position:])
+                if macro is not None:
+                    disabled.discard(macro)
+                    output.append(" ")
+                continue
+            output.append(text[position : match.start()])
+            stack.append((text, match.end(), macro))
+            word = match.group()
+            body = self.macros.get(word)
+            if body is None:
+                if word.startswith("__") or word in PREDEFINED:
+                    raise UnsupportedConstruct(f"Predefined macro {word}")
+                output.append(word)
+            elif word in disabled:
+                output.append(word)
+            else:
+                disabled.add(word)
+                output.append(" ")
+                stack.append((body, 0, word))
+        return "".join(output)
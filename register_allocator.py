@@ -0,0 +1,164 @@
+from assembly_generator import (
+    AssemblyInstruction,
+    AssemblyOperand,
+    Mov,
+    Unary,
+    Pseudo,
+    Register,
+    Stack,
+    REGISTERS,
+)
+from dispatch import TypeDispatch
+
+
+# Caller-saved registers free for pseudos. EAX carries the return value and
+# R10 is the scratch register of fix_mov_double_address, so both stay out.
+ALLOCATABLE_REGISTERS = [
+    Register.ECX,
+    Register.EDX,
+    Register.ESI,
+    Register.EDI,
+    Register.R8,
+    Register.R9,
+    Register.R11,
+]
+
+
+# (used, defined) pseudo names of one instruction
+instruction_pseudos = TypeDispatch("Unknown instruction type: {name}", arg=0)
+
+
+@instruction_pseudos.register(Mov)
+def mov_pseudos(instruction: Mov) -> tuple[list[str], list[str]]:
+    src, dst = instruction.src, instruction.dst
+    used = [src.identifier] if type(src) is Pseudo else []
+    defined = [dst.identifier] if type(dst) is Pseudo else []
+    return used, defined
+
+
+@instruction_pseudos.register(Unary)
+def unary_pseudos(instruction: Unary) -> tuple[list[str], list[str]]:
+    operand = instruction.operand
+    if type(operand) is Pseudo:
+        return [operand.identifier], [operand.identifier]
+    return [], []
+
+
+@instruction_pseudos.register(AssemblyInstruction)
+def no_pseudos(instruction: AssemblyInstruction) -> tuple[list[str], list[str]]:
+    return [], []
+
+
+class RegisterAllocator:
+    def __init__(self, registers: list[Register] | None = None) -> None:
+        self.registers = registers if registers is not None else ALLOCATABLE_REGISTERS
+        self.stack_size = 0
+        self.spilled: list[str] = []
+
+    def allocate(
+        self, instructions: list[AssemblyInstruction]
+    ) -> dict[str, AssemblyOperand]:
+        # Map every pseudo to a register, or to a stack slot when it had to
+        # be spilled. Spilled pseudos whose lifetimes do not overlap share a
+        # slot, so stack_size only covers the slots actually needed.
+        interference, moves, order = self.build_interference(instructions)
+        colors = self.color(interference, moves, order, len(self.registers))
+
+        assignment: dict[str, AssemblyOperand] = {}
+        for name, color in colors.items():
+            assignment[name] = REGISTERS[self.registers[color]]
+
+        self.spilled = [name for name in order if name not in colors]
+        slots = self.color(interference, moves, self.spilled, None)
+        for name in self.spilled:
+            assignment[name] = Stack(-4 * (slots[name] + 1))
+        self.stack_size = 4 * (max(slots.values()) + 1) if slots else 0
+        return assignment
+
+    def build_interference(
+        self, instructions: list[AssemblyInstruction]
+    ) -> tuple[dict[str, set[str]], dict[str, set[str]], list[str]]:
+        # Backward liveness over the straight-line body. A definition
+        # interferes with everything live after it, except the source of a
+        # Mov, which may share its location.
+        interference: dict[str, set[str]] = {}
+        moves: dict[str, set[str]] = {}
+        order: list[str] = []
+        for instruction in instructions:
+            used, defined = instruction_pseudos(instruction)
+            for name in used + defined:
+                if name not in interference:
+                    interference[name] = set()
+                    moves[name] = set()
+                    order.append(name)
+
+        live: set[str] = set()
+        for instruction in reversed(instructions):
+            used, defined = instruction_pseudos(instruction)
+            move_src = None
+            if type(instruction) is Mov and used and defined:
+                move_src = used[0]
+                moves[move_src].add(defined[0])
+                moves[defined[0]].add(move_src)
+            for d in defined:
+                for other in live:
+                    if other != d and other != move_src:
+                        interference[d].add(other)
+                        interference[other].add(d)
+            live.difference_update(defined)
+            live.update(used)
+        return interference, moves, order
+
+    def color(
+        self,
+        interference: dict[str, set[str]],
+        moves: dict[str, set[str]],
+        nodes: list[str],
+        k: int | None,
+    ) -> dict[str, int]:
+        # Chaitin-Briggs style: simplify nodes of degree < k onto a stack,
+        # optimistically push a high-degree node when stuck, then pop and
+        # give each node the lowest free color, preferring the color of a
+        # move partner. With k=None colors are unbounded (stack slots).
+        members = set(nodes)
+        degree = {n: len(interference[n] & members) for n in nodes}
+        removed: set[str] = set()
+        stack: list[str] = []
+
+        if k is None:
+            stack = list(reversed(nodes))
+        else:
+            worklist = [n for n in nodes if degree[n] < k]
+            remaining = set(nodes)
+            while remaining:
+                if worklist:
+                    node = worklist.pop()
+                    if node in removed:
+                        continue
+                else:
+                    node = max(remaining, key=lambda n: degree[n])
+                removed.add(node)
+                remaining.discard(node)
+                stack.append(node)
+                for neighbor in interference[node]:
+                    if neighbor in remaining:
+                        degree[neighbor] -= 1
+                        if degree[neighbor] == k - 1:
+                            worklist.append(neighbor)
+
+        colors: dict[str, int] = {}
+        while stack:
+            node = stack.pop()
+            taken = {colors[n] for n in interference[node] if n in colors}
+            preferred = [
+                colors[n] for n in moves[node] if n in colors and colors[n] not in taken
+            ]
+            if preferred:
+                colors[node] = preferred[0]
+                continue
+            color = 0
+            while color in taken:
+                color += 1
+            if k is None or color < k:
+                colors[node] = color
+        return colors
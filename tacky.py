@@ -1,5 +1,8 @@
 from dataclasses import dataclass
 from abc import ABC
+import threading
+from weakref import WeakValueDictionary
+from dispatch import TypeDispatch
 from parser import (
     Program,
     Statement,
@@ -15,60 +18,90 @@ from parser import (
 
 
 class TackyVal(ABC):
-    pass
+    __slots__ = ()
 
 
 class TackyUnaryOperator(ABC):
-    pass
+    __slots__ = ()
 
 
 class TackyInstruction(ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class TackyProgram:
     function_definition: "TackyFunction"
 
 
-@dataclass
+@dataclass(slots=True)
 class TackyFunction:
     name: str
     body: list[TackyInstruction]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TackyReturn(TackyInstruction):
     val: "TackyVal"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TackyUnary(TackyInstruction):
     unary_operator: TackyUnaryOperator
     src: TackyVal
     dst: TackyVal
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class TackyCopy(TackyInstruction):
+    src: TackyVal
+    dst: TackyVal
+
+
+@dataclass(frozen=True, slots=True, weakref_slot=True)
 class TackyConstant(TackyVal):
     value: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TackyVar(TackyVal):
     identifier: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TackyComplement(TackyUnaryOperator):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TackyNegate(TackyUnaryOperator):
     pass
 
 
+# TACKY values are immutable, so equal constants are hash-consed to one
+# shared object. Each temporary is created once by make_temporary and the
+# same TackyVar is reused as the next source, so variables need no table.
+# Operators carry no state and are singletons.
+TACKY_COMPLEMENT = TackyComplement()
+TACKY_NEGATE = TackyNegate()
+
+_interned_constants: "WeakValueDictionary[int, TackyConstant]" = WeakValueDictionary()
+_intern_lock = threading.Lock()
+
+
+def make_constant(value: int) -> TackyConstant:
+    constant = _interned_constants.get(value)
+    if constant is None:
+        # Only a miss takes the lock, so threads compiling at once still
+        # share one object per value
+        with _intern_lock:
+            constant = _interned_constants.get(value)
+            if constant is None:
+                constant = TackyConstant(value)
+                _interned_constants[value] = constant
+    return constant
+
+
 class TackyGenerator:
     def __init__(self, ast: Program) -> None:
         self.ast = ast
@@ -88,47 +121,60 @@ class TackyGenerator:
 
         if isinstance(function_body, Return):
 
-            result_val, tacky_instructions = self.emit_tacky(function_body.exp)
+            tacky_instructions: list[TackyInstruction] = []
+            result_val = self.emit_tacky(function_body.exp, tacky_instructions)
             tacky_instructions.append(TackyReturn(result_val))
             return tacky_instructions
         return []
 
-    def emit_tacky(
-        self, func_body_expression: Expression
-    ) -> tuple[TackyVal, list[TackyInstruction]]:
-
-        match func_body_expression:
-
-            case Constant(c):
-                return (TackyConstant(c), [])
+    # A lowering step returns (result, None) for a leaf operand, or
+    # (None, inner) after pushing the operator to apply once inner is done.
+    expression_lowerers = TypeDispatch("Unknown expression type: {type}")
 
-            case Unary(operator, inner):
-
-                src, instructions = self.emit_tacky(inner)
-                dst_name = self.make_temporary()
-                dst = TackyVar(dst_name)
-                tacky_op: TackyUnaryOperator = self.convert_unop(operator)
-                unary_instr = TackyUnary(tacky_op, src, dst)
-                return (dst, instructions + [unary_instr])
-
-            case _:
-                raise ValueError(
-                    f"Unknown expression type: {type(func_body_expression)}"
-                )
+    def emit_tacky(
+        self, func_body_expression: Expression, instructions: list[TackyInstruction]
+    ) -> TackyVal:
+        # Walk down to the innermost operand with an explicit stack of the
+        # operators passed on the way, then emit from the inside out. Every
+        # instruction is appended once to the caller's buffer, so lowering
+        # is linear in expression depth and never hits the recursion limit.
+        operators: list[UnaryOperator] = []
+        expression: Expression | None = func_body_expression
+        result: TackyVal | None = None
+        while result is None:
+            result, expression = self.expression_lowerers(self, expression, operators)
+
+        while operators:
+            operator = operators.pop()
+            dst = TackyVar(self.make_temporary())
+            tacky_op: TackyUnaryOperator = self.convert_unop(operator)
+            instructions.append(TackyUnary(tacky_op, result, dst))
+            result = dst
+        return result
+
+    @expression_lowerers.register(Constant)
+    def lower_constant(self, expression: Constant, operators: list[UnaryOperator]):
+        return make_constant(expression.value), None
+
+    @expression_lowerers.register(Unary)
+    def lower_unary(self, expression: Unary, operators: list[UnaryOperator]):
+        operators.append(expression.unary_operator)
+        return None, expression.exp
 
     def make_temporary(self):
         name = f"tmp.{self.temp_counter}"
         self.temp_counter += 1
         return name
 
-    def convert_unop(self, operator: UnaryOperator) -> TackyUnaryOperator:
+    unary_operator_converters = TypeDispatch("Unknown operator: {type}")
 
-        match operator:
+    def convert_unop(self, operator: UnaryOperator) -> TackyUnaryOperator:
+        return self.unary_operator_converters(self, operator)
 
-            case Complement():
-                return TackyComplement()
+    @unary_operator_converters.register(Complement)
+    def convert_complement(self, operator: Complement) -> TackyUnaryOperator:
+        return TACKY_COMPLEMENT
 
-            case Negate():
-                return TackyNegate()
-            case _:
-                raise ValueError(f"Unknown operator: {type(operator)}")
+    @unary_operator_converters.register(Negate)
+    def convert_negate(self, operator: Negate) -> TackyUnaryOperator:
+        return TACKY_NEGATE
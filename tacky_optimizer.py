@@ -0,0 +1,395 @@
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from dispatch import TypeDispatch
+from tacky import (
+    TackyProgram,
+    TackyFunction,
+    TackyInstruction,
+    TackyReturn,
+    TackyUnary,
+    TackyCopy,
+    TackyVal,
+    TackyConstant,
+    TackyVar,
+    TackyUnaryOperator,
+    TackyComplement,
+    TackyNegate,
+    make_constant,
+)
+
+
+def wrap_int32(value: int) -> int:
+    # Reduce to the signed 32-bit two's-complement range of an int
+    return ((value + 2**31) % 2**32) - 2**31
+
+
+unary_folders = TypeDispatch("Unknown TACKY operator type: {type}", arg=0)
+
+
+@unary_folders.register(TackyComplement)
+def fold_complement(operator: TackyComplement, value: int) -> int:
+    return wrap_int32(~value)
+
+
+@unary_folders.register(TackyNegate)
+def fold_negate(operator: TackyNegate, value: int) -> int:
+    return wrap_int32(-value)
+
+
+def fold_unary(operator: TackyUnaryOperator, value: int) -> int:
+    return unary_folders(operator, value)
+
+
+instruction_uses = TypeDispatch("Unknown instruction type: {type}", arg=0)
+instruction_uses.register(TackyUnary, TackyCopy)(lambda instruction: [instruction.src])
+instruction_uses.register(TackyReturn)(lambda instruction: [instruction.val])
+
+
+# Name of the variable an instruction defines, if any
+instruction_def = TypeDispatch("Unknown instruction type: {type}", arg=0)
+
+
+@instruction_def.register(TackyUnary, TackyCopy)
+def dst_def(instruction: TackyUnary | TackyCopy) -> str | None:
+    dst = instruction.dst
+    return dst.identifier if type(dst) is TackyVar else None
+
+
+instruction_def.register(TackyReturn)(lambda instruction: None)
+
+
+def is_terminator(instruction: TackyInstruction) -> bool:
+    # Jumps and conditional jumps will end blocks here as well
+    return isinstance(instruction, TackyReturn)
+
+
+@dataclass
+class BasicBlock:
+    instructions: list[TackyInstruction]
+    successors: list[int] = field(default_factory=list)
+    predecessors: list[int] = field(default_factory=list)
+
+
+def build_cfg(instructions: list[TackyInstruction]) -> list[BasicBlock]:
+    # Split the body into basic blocks and link fall-through edges. Labels
+    # will start new blocks, and jumps will add edges to their targets.
+    blocks: list[BasicBlock] = []
+    current: list[TackyInstruction] = []
+    for instruction in instructions:
+        current.append(instruction)
+        if is_terminator(instruction):
+            blocks.append(BasicBlock(current))
+            current = []
+    if current:
+        blocks.append(BasicBlock(current))
+
+    for index, block in enumerate(blocks):
+        if not is_terminator(block.instructions[-1]) and index + 1 < len(blocks):
+            block.successors.append(index + 1)
+            blocks[index + 1].predecessors.append(index)
+    return blocks
+
+
+def solve_dataflow(
+    blocks: list[BasicBlock],
+    forward: bool,
+    boundary,
+    meet: Callable,
+    transfer: Callable,
+) -> dict[int, object]:
+    # Iterative worklist solver. Returns the fact at the start of each block
+    # in the direction of the analysis: the IN set for forward problems and
+    # the OUT set for backward ones.
+    facts_in: dict[int, object] = {}
+    facts_out: dict[int, object] = {}
+    worklist = list(range(len(blocks)))
+    if not forward:
+        worklist.reverse()
+    while worklist:
+        index = worklist.pop(0)
+        block = blocks[index]
+        sources = block.predecessors if forward else block.successors
+        known = [facts_out[s] for s in sources if s in facts_out]
+        fact = meet(known) if known else boundary
+        facts_in[index] = fact
+        out = transfer(block, fact)
+        if facts_out.get(index) != out:
+            facts_out[index] = out
+            for target in block.successors if forward else block.predecessors:
+                if target not in worklist:
+                    worklist.append(target)
+    return facts_in
+
+
+class ReachingCopies:
+    # Copies that reach a program point, as dst -> src, with a reverse index
+    # so that redefining a variable kills every copy reading it in O(1).
+
+    def __init__(self, copies: dict[str, TackyVal] | None = None) -> None:
+        self.copies: dict[str, TackyVal] = {}
+        self.readers: dict[str, set[str]] = {}
+        for dst, src in (copies or {}).items():
+            self.add(dst, src)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ReachingCopies) and self.copies == other.copies
+
+    def get(self, identifier: str) -> TackyVal | None:
+        return self.copies.get(identifier)
+
+    def add(self, dst: str, src: TackyVal) -> None:
+        self.copies[dst] = src
+        if isinstance(src, TackyVar):
+            self.readers.setdefault(src.identifier, set()).add(dst)
+
+    def kill(self, identifier: str) -> None:
+        src = self.copies.pop(identifier, None)
+        if isinstance(src, TackyVar):
+            self.readers[src.identifier].discard(identifier)
+        for dst in self.readers.pop(identifier, ()):
+            self.copies.pop(dst, None)
+
+    def copy(self) -> "ReachingCopies":
+        return ReachingCopies(self.copies)
+
+
+def meet_copies(facts: list[ReachingCopies]) -> ReachingCopies:
+    # A copy reaches a block only if it reaches along every incoming edge
+    first, *rest = facts
+    return ReachingCopies(
+        {
+            dst: src
+            for dst, src in first.copies.items()
+            if all(f.get(dst) == src for f in rest)
+        }
+    )
+
+
+def meet_live(facts: list[frozenset[str]]) -> frozenset[str]:
+    return frozenset().union(*facts)
+
+
+class TackyOptimizer:
+    def __init__(self, tacky_program: TackyProgram) -> None:
+        self.tacky_program = tacky_program
+        self.removed_instructions = 0
+        self.stats: dict[str, int] = {}
+
+    def optimize(self) -> TackyProgram:
+
+        func = self.tacky_program.function_definition
+        body = func.body
+        self.stats = {
+            "instructions_before": len(body),
+            "temporaries_before": count_temporaries(body),
+            "constant_folding": 0,
+            "value_numbering": 0,
+            "copy_propagation": 0,
+            "dead_store_elimination": 0,
+        }
+
+        # Each pass can expose more work for the others, so run them to a
+        # fixed point.
+        while True:
+            folded = self.fold_constants(body)
+            numbered = self.number_values(folded)
+            propagated = self.propagate_copies(numbered)
+            pruned = self.eliminate_dead_stores(propagated)
+            if pruned == body:
+                break
+            body = pruned
+
+        self.stats["instructions_after"] = len(body)
+        self.stats["temporaries_after"] = count_temporaries(body)
+        self.removed_instructions = len(func.body) - len(body)
+        return TackyProgram(TackyFunction(name=func.name, body=body))
+
+    def fold_constants(
+        self, instructions: list[TackyInstruction]
+    ) -> list[TackyInstruction]:
+        # A TackyUnary over a constant is evaluated at compile time and
+        # becomes a copy of the result, which copy propagation pushes into
+        # the uses. Constants copied earlier in the same block are folded
+        # through directly, so a whole chain folds in one pass.
+        folded: list[TackyInstruction] = []
+        for block in build_cfg(instructions):
+            constants: dict[str, int] = {}
+            for instruction in block.instructions:
+                match instruction:
+                    case TackyUnary(unary_operator, src, TackyVar(identifier) as dst):
+                        if isinstance(src, TackyVar) and src.identifier in constants:
+                            src = make_constant(constants[src.identifier])
+                        if isinstance(src, TackyConstant):
+                            value = fold_unary(unary_operator, src.value)
+                            constants[identifier] = value
+                            instruction = TackyCopy(make_constant(value), dst)
+                            self.stats["constant_folding"] += 1
+                        else:
+                            constants.pop(identifier, None)
+                    case TackyCopy(TackyConstant(value), TackyVar(identifier)):
+                        constants[identifier] = value
+                    case _:
+                        defined = instruction_def(instruction)
+                        if defined is not None:
+                            constants.pop(defined, None)
+                folded.append(instruction)
+        return folded
+
+    def number_values(
+        self, instructions: list[TackyInstruction]
+    ) -> list[TackyInstruction]:
+        # Local value numbering: within a block, a TackyUnary computing the
+        # same (operator, src) as an earlier one whose result is still
+        # intact becomes a copy of that result. Values and operators are
+        # hash-consed, so the pair itself is the table key.
+        numbered: list[TackyInstruction] = []
+        for block in build_cfg(instructions):
+            available: dict[tuple[TackyUnaryOperator, TackyVal], TackyVar] = {}
+            keys_by_var: dict[str, list[tuple[TackyUnaryOperator, TackyVal]]] = {}
+            for instruction in block.instructions:
+                match instruction:
+                    case TackyUnary(unary_operator, src, TackyVar(identifier) as dst):
+                        key = (unary_operator, src)
+                        previous = available.get(key)
+                        if previous is not None and previous != dst:
+                            instruction = TackyCopy(previous, dst)
+                            self.stats["value_numbering"] += 1
+                defined = instruction_def(instruction)
+                if defined is not None:
+                    # Redefining a variable invalidates every entry that
+                    # reads it or that it holds the result of.
+                    for stale in keys_by_var.pop(defined, ()):
+                        available.pop(stale, None)
+                match instruction:
+                    case TackyUnary(unary_operator, src, TackyVar(identifier) as dst):
+                        key = (unary_operator, src)
+                        if src != dst:
+                            available[key] = dst
+                            keys_by_var.setdefault(identifier, []).append(key)
+                            if isinstance(src, TackyVar):
+                                keys_by_var.setdefault(src.identifier, []).append(key)
+                numbered.append(instruction)
+        return numbered
+
+    def propagate_copies(
+        self, instructions: list[TackyInstruction]
+    ) -> list[TackyInstruction]:
+        # Reaching-copies analysis: replace each use of a variable with the
+        # source of the copy that defined it, as long as neither side has
+        # been redefined since.
+        blocks = build_cfg(instructions)
+        reaching = solve_dataflow(
+            blocks, True, ReachingCopies(), meet_copies, self.transfer_copies_block
+        )
+
+        propagated: list[TackyInstruction] = []
+        for index, block in enumerate(blocks):
+            copies = reaching[index].copy()
+            for instruction in block.instructions:
+                rewritten = self.rewrite_uses(instruction, copies)
+                if rewritten != instruction:
+                    self.stats["copy_propagation"] += 1
+                match rewritten:
+                    case TackyCopy(src, dst) if src == dst:
+                        continue
+                propagated.append(rewritten)
+                self.transfer_copies(rewritten, copies)
+        return propagated
+
+    def transfer_copies_block(
+        self, block: BasicBlock, copies: ReachingCopies
+    ) -> ReachingCopies:
+        copies = copies.copy()
+        for instruction in block.instructions:
+            self.transfer_copies(self.rewrite_uses(instruction, copies), copies)
+        return copies
+
+    def transfer_copies(
+        self, instruction: TackyInstruction, copies: ReachingCopies
+    ) -> None:
+        defined = instruction_def(instruction)
+        if defined is None:
+            return
+        copies.kill(defined)
+        match instruction:
+            case TackyCopy(src, TackyVar(identifier)) if src != TackyVar(identifier):
+                copies.add(identifier, src)
+
+    def rewrite_uses(
+        self, instruction: TackyInstruction, copies: ReachingCopies
+    ) -> TackyInstruction:
+        return self.use_rewriters(self, instruction, copies)
+
+    use_rewriters = TypeDispatch("Unknown instruction type: {type}")
+
+    @use_rewriters.register(TackyUnary)
+    def rewrite_unary(self, instruction: TackyUnary, copies: ReachingCopies):
+        return TackyUnary(
+            instruction.unary_operator,
+            replace_use(instruction.src, copies),
+            instruction.dst,
+        )
+
+    @use_rewriters.register(TackyCopy)
+    def rewrite_copy(self, instruction: TackyCopy, copies: ReachingCopies):
+        return TackyCopy(replace_use(instruction.src, copies), instruction.dst)
+
+    @use_rewriters.register(TackyReturn)
+    def rewrite_return(self, instruction: TackyReturn, copies: ReachingCopies):
+        return TackyReturn(replace_use(instruction.val, copies))
+
+    def eliminate_dead_stores(
+        self, instructions: list[TackyInstruction]
+    ) -> list[TackyInstruction]:
+        # Liveness analysis: an instruction whose only effect is writing a
+        # temporary that is never read afterwards is removed.
+        blocks = build_cfg(instructions)
+        live_out = solve_dataflow(
+            blocks, False, frozenset(), meet_live, self.transfer_live_block
+        )
+
+        kept_blocks: list[list[TackyInstruction]] = []
+        for index, block in enumerate(blocks):
+            live = set(live_out[index])
+            kept: list[TackyInstruction] = []
+            for instruction in reversed(block.instructions):
+                defined = instruction_def(instruction)
+                if defined is not None and defined not in live:
+                    self.stats["dead_store_elimination"] += 1
+                    continue
+                kept.append(instruction)
+                self.transfer_live(instruction, live)
+            kept.reverse()
+            kept_blocks.append(kept)
+        return [instruction for kept in kept_blocks for instruction in kept]
+
+    def transfer_live_block(
+        self, block: BasicBlock, live: frozenset[str]
+    ) -> frozenset[str]:
+        current = set(live)
+        for instruction in reversed(block.instructions):
+            self.transfer_live(instruction, current)
+        return frozenset(current)
+
+    def transfer_live(self, instruction: TackyInstruction, live: set[str]) -> None:
+        defined = instruction_def(instruction)
+        if defined is not None:
+            live.discard(defined)
+        for val in instruction_uses(instruction):
+            if isinstance(val, TackyVar):
+                live.add(val.identifier)
+
+
+def replace_use(val: TackyVal, copies: ReachingCopies) -> TackyVal:
+    if type(val) is TackyVar:
+        return copies.get(val.identifier) or val
+    return val
+
+
+def count_temporaries(instructions: list[TackyInstruction]) -> int:
+    names = set()
+    for instruction in instructions:
+        defined = instruction_def(instruction)
+        if defined is not None:
+            names.add(defined)
+    return len(names)
@@ -0,0 +1,69 @@
+import pytest
+from lexer import Lexer, TokenType
+from parser import Parser
+
+
+def lexemes(source: str, chunk_size: int) -> list[str]:
+    return [token.lexeme for token in Lexer.from_source(source, chunk_size).stream()]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 16, 1 << 16])
+def test_whitespace_runs_across_chunks(chunk_size):
+    gap = " \t\n" * 40
+    source = f"int{gap}main(void){gap}{{{gap}return{gap}-~12345{gap}; }}{gap}"
+    assert lexemes(source, chunk_size) == [
+        "int", "main", "(", "void", ")", "{", "return", "-", "~", "12345", ";", "}"
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 8])
+def test_tokens_split_across_chunks(chunk_size):
+    source = "int " + "x" * 50 + " " + "9" * 40 + " -~-"
+    tokens = list(Lexer.from_source(source, chunk_size).stream())
+    assert [token.lexeme for token in tokens] == [
+        "int", "x" * 50, "9" * 40, "-", "~", "-"
+    ]
+    assert tokens[0].tt is TokenType.INT
+    assert tokens[2].value == int("9" * 40)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1 << 16])
+def test_error_positions_are_absolute(chunk_size):
+    source = "int" + " " * 30 + "main @"
+    with pytest.raises(ValueError, match="Unexpected character '@' at position 38"):
+        list(Lexer.from_source(source, chunk_size).stream())
+    with pytest.raises(ValueError, match="two_hyphen yet at '-' at position 38"):
+        list(Lexer.from_source(source[:-1] + "--", chunk_size).stream())
+
+
+BUFFER_SOURCES = [
+    "int main(void) { return -~-(2147483647); }",
+    "int main(void) { return " + "9" * 30 + "; }",
+    "int foo(void) { return -foo_bar; } foo",
+    "int main(void) {\n\treturn 1;\n}\n",
+]
+
+
+@pytest.mark.parametrize("source", BUFFER_SOURCES)
+def test_token_buffer_matches_tokenize(source):
+    tokens = Lexer.from_source(source).tokenize()
+    buffer = Lexer.from_source(source).tokenize_compact()
+    assert len(buffer) == len(tokens)
+    assert list(buffer) == tokens
+    assert buffer[-1] == tokens[-1]
+
+
+@pytest.mark.parametrize("source", ["int main(void) { return @; }", "return --1;"])
+def test_token_buffer_errors_match_tokenize(source):
+    with pytest.raises(ValueError) as streamed:
+        Lexer.from_source(source).tokenize()
+    with pytest.raises(ValueError) as compact:
+        Lexer.from_source(source).tokenize_compact()
+    assert str(compact.value) == str(streamed.value)
+
+
+def test_parser_runs_on_token_buffer():
+    source = BUFFER_SOURCES[0]
+    buffer = Lexer.from_source(source).tokenize_compact()
+    expected = Parser(Lexer.from_source(source).tokenize()).parse_program()
+    assert Parser(buffer).parse_program() == expected
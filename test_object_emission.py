@@ -0,0 +1,113 @@
+import random
+import shutil
+import subprocess
+import pytest
+from api import compile_string
+from assembly_emission import AssemblyEmitter
+from assembly_generator import (
+    AllocateStack,
+    AssemblyFunction,
+    AssemblyProgram,
+    EAX,
+    ImmediateValue,
+    Mov,
+    NEG,
+    NOT,
+    RET,
+    REGISTERS,
+    Stack,
+    Unary,
+)
+from benchmark import unary_chain
+from object_emission import ObjectEmitter
+
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("gcc") is None or shutil.which("objdump") is None,
+    reason="needs gcc and objdump",
+)
+
+SAMPLES = [
+    "int main(void) { return 2; }",
+    "int main(void) { return -~(5); }",
+    "int main(void) { return ~(-(~(-(((3)))))); }",
+    "int main(void) { return -2147483647; }",
+    "int main(void) { return 4294967297; }",
+    "int main(void) { return ~" + "9" * 30 + "; }",
+    unary_chain(300),
+]
+
+
+def random_expression(rng: random.Random, depth: int) -> str:
+    if depth == 0:
+        constants = [0, 1, 127, 128, 65535, 2147483647, rng.randrange(10**6)]
+        return str(rng.choice(constants))
+    inner = random_expression(rng, depth - 1)
+    return rng.choice("-~") + " " + (f"({inner})" if rng.random() < 0.5 else inner)
+
+
+rng = random.Random(7)
+SAMPLES += [
+    f"int main(void) {{ return {random_expression(rng, rng.randrange(1, 60))}; }}"
+    for _ in range(10)
+]
+
+
+def disassemble(path) -> list[str]:
+    # Instruction listing and the function's symbol, without the file name
+    listing = subprocess.run(
+        ["objdump", "-d", "-w", path], check=True, capture_output=True, text=True
+    ).stdout
+    symbols = subprocess.run(
+        ["objdump", "-t", path], check=True, capture_output=True, text=True
+    ).stdout
+    return listing.splitlines()[3:] + [
+        line for line in symbols.splitlines() if line.endswith(" main")
+    ]
+
+
+def assert_same_object(assembly_ast: AssemblyProgram, tmp_path) -> None:
+    assembly = tmp_path / "gas.s"
+    with open(assembly, "w") as f:
+        AssemblyEmitter(assembly_ast).emit_to(f)
+    subprocess.run(
+        ["gcc", "-c", assembly, "-o", tmp_path / "gas.o"],
+        check=True,
+        capture_output=True,
+    )
+    with open(tmp_path / "ours.o", "wb") as f:
+        ObjectEmitter(assembly_ast).emit_to(f)
+    assert disassemble(tmp_path / "ours.o") == disassemble(tmp_path / "gas.o")
+
+
+@pytest.mark.parametrize("opt_level", [0, 1])
+@pytest.mark.parametrize("source", SAMPLES)
+def test_sample_matches_gas(source, opt_level, tmp_path):
+    assembly_ast = compile_string(
+        source, stop="assembly", opt_level=opt_level, preprocess=False
+    )
+    assert_same_object(assembly_ast, tmp_path)
+
+
+def test_every_encoding_matches_gas(tmp_path):
+    registers = list(REGISTERS.values())
+    # disp8 and disp32 slots on both sides of the boundary
+    slots = [Stack(-4), Stack(-128), Stack(-129), Stack(-131072)]
+    # Out of range ones are shortened to their low 32 bits
+    immediates = [0, 5, -5, 127, 128, -2147483648, 2147483647, 4294967295]
+    immediates += [4294967297, -4294967297, 1 << 40]
+    # subq with an imm8 and with an imm32
+    instructions = [AllocateStack(8), AllocateStack(127), AllocateStack(128)]
+    instructions.append(AllocateStack(100000))
+    for register in registers:
+        instructions += [Mov(register, other) for other in registers]
+        instructions += [Mov(ImmediateValue(value), register) for value in immediates]
+        for slot in slots:
+            instructions += [Mov(register, slot), Mov(slot, register)]
+        instructions += [Unary(NEG, register), Unary(NOT, register)]
+    for slot in slots:
+        instructions += [Mov(ImmediateValue(value), slot) for value in immediates]
+        instructions += [Unary(NEG, slot), Unary(NOT, slot)]
+    instructions += [Mov(Stack(-4), EAX), RET]
+    program = AssemblyProgram(AssemblyFunction("main", instructions))
+    assert_same_object(program, tmp_path)
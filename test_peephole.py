@@ -0,0 +1,161 @@
+import pytest
+from assembly_generator import (
+    AllocateStack,
+    AssemblyFunction,
+    AssemblyGenerator,
+    AssemblyProgram,
+    ImmediateValue,
+    Mov,
+    NEG,
+    NOT,
+    RET,
+    REGISTERS,
+    Register,
+    Stack,
+    Unary,
+    EAX,
+    R10,
+)
+from conftest import requires_gcc
+from peephole import PEEPHOLE_RULES, PeepholeOptimizer
+from register_allocator import RegisterAllocator
+from tacky import (
+    TACKY_COMPLEMENT,
+    TACKY_NEGATE,
+    TackyCopy,
+    TackyFunction,
+    TackyProgram,
+    TackyReturn,
+    TackyUnary,
+    TackyVar,
+    make_constant,
+)
+
+
+ECX = REGISTERS[Register.ECX]
+EDX = REGISTERS[Register.EDX]
+S1, S2 = Stack(-4), Stack(-8)
+RULES = {name: rule for name, _, rule in PEEPHOLE_RULES}
+
+# (rule, window, expected replacement or None when the rule must not fire)
+CASES = [
+    ("self_move", [Mov(ECX, ECX)], []),
+    ("self_move", [Mov(S1, S1)], []),
+    ("self_move", [Mov(ECX, EDX)], None),
+    (
+        "fold_immediate_unary",
+        [Mov(ImmediateValue(5), S1), Unary(NEG, S1)],
+        [Mov(ImmediateValue(-5), S1)],
+    ),
+    (
+        "fold_immediate_unary",
+        [Mov(ImmediateValue(-2147483648), S1), Unary(NEG, S1)],
+        [Mov(ImmediateValue(-2147483648), S1)],
+    ),
+    (
+        "fold_immediate_unary",
+        [Mov(ImmediateValue(5), ECX), Unary(NOT, ECX)],
+        [Mov(ImmediateValue(-6), ECX)],
+    ),
+    ("fold_immediate_unary", [Mov(ImmediateValue(5), S1), Unary(NEG, S2)], None),
+    ("scratch_round_trip", [Mov(S1, R10), Mov(R10, S1)], []),
+    ("scratch_round_trip", [Mov(S1, R10), Mov(R10, S2)], None),
+    ("move_back", [Mov(ECX, S1), Mov(S1, ECX)], [Mov(ECX, S1)]),
+    ("move_back", [Mov(ECX, S1), Mov(S1, EDX)], None),
+    ("store_reload", [Mov(ECX, S1), Mov(S1, EDX)], [Mov(ECX, S1), Mov(ECX, EDX)]),
+    (
+        "store_reload",
+        [Mov(ImmediateValue(3), S1), Mov(S1, S2)],
+        [Mov(ImmediateValue(3), S1), Mov(ImmediateValue(3), S2)],
+    ),
+    # Would become a memory-to-memory move
+    ("store_reload", [Mov(S2, R10), Mov(R10, S1)], None),
+    ("store_reload", [Mov(S2, S1), Mov(S1, EDX)], [Mov(S2, S1), Mov(S2, EDX)]),
+    ("store_reload", [Mov(ECX, S1), Mov(S2, EDX)], None),
+    ("dead_scratch", [Mov(S1, R10), Mov(ECX, S2)], [Mov(ECX, S2)]),
+    ("dead_scratch", [Mov(S1, R10), Unary(NEG, S2)], [Unary(NEG, S2)]),
+    ("dead_scratch", [Mov(S1, R10), Mov(R10, S2)], None),
+    ("dead_scratch", [Mov(S1, R10), Unary(NOT, R10)], None),
+    ("overwritten_store", [Mov(ECX, S1), Mov(EDX, S1)], [Mov(EDX, S1)]),
+    ("overwritten_store", [Mov(ECX, S1), Mov(S1, S1)], None),
+    ("overwritten_store", [Mov(ECX, S1), Mov(EDX, S2)], None),
+    (
+        "dead_store_before_return",
+        [Mov(ECX, S1), Mov(EDX, EAX), RET],
+        [Mov(EDX, EAX), RET],
+    ),
+    ("dead_store_before_return", [Mov(ECX, S1), Mov(S1, EAX), RET], None),
+    ("dead_store_before_return", [Mov(ECX, EAX), Mov(EDX, S1), RET], None),
+    ("dead_store_at_return", [Mov(ECX, S1), RET], [RET]),
+    ("dead_store_at_return", [Mov(ECX, EAX), RET], None),
+]
+
+
+def test_every_rule_has_cases():
+    assert {name for name, _, _ in CASES} == set(RULES)
+
+
+@pytest.mark.parametrize("name, window, expected", CASES)
+def test_rule(name, window, expected):
+    assert RULES[name](window) == expected
+
+
+def optimize(instructions):
+    function = AssemblyFunction("main", instructions)
+    optimizer = PeepholeOptimizer(AssemblyProgram(function))
+    return optimizer.optimize().function_definition.instructions, optimizer
+
+
+def test_unused_frame_dropped():
+    instructions, optimizer = optimize(
+        [AllocateStack(8), Mov(ImmediateValue(1), ECX), Mov(ECX, EAX), RET]
+    )
+    assert instructions == [Mov(ImmediateValue(1), EAX), RET]
+    assert optimizer.rule_counts["unused_frame"] == 1
+
+
+def test_used_frame_kept():
+    instructions, optimizer = optimize(
+        [AllocateStack(4), Unary(NEG, S1), Mov(S1, EAX), RET]
+    )
+    assert instructions[0] == AllocateStack(4)
+    assert optimizer.rule_counts["unused_frame"] == 0
+
+
+def spilled_function(name: str, allocated: bool):
+    # Overlapping values: with no registers all of them live on the stack
+    # and every move between them goes through %r10d
+    a, b, c, d = (TackyVar(n) for n in "abcd")
+    body = [
+        TackyCopy(make_constant(2147483647), a),
+        TackyUnary(TACKY_NEGATE, a, b),
+        TackyCopy(b, c),
+        TackyUnary(TACKY_COMPLEMENT, a, a),
+        TackyCopy(c, d),
+        TackyUnary(TACKY_NEGATE, d, d),
+        TackyCopy(a, b),
+        TackyUnary(TACKY_COMPLEMENT, b, c),
+        TackyUnary(TACKY_NEGATE, c, c),
+        TackyCopy(c, a),
+        TackyReturn(a),
+    ]
+    allocator = RegisterAllocator([]) if allocated else None
+    program = TackyProgram(TackyFunction(name, body))
+    return AssemblyGenerator(program, allocator).generate_assembly_ast()
+
+
+@requires_gcc
+def test_spilled_code_keeps_its_meaning(run_functions):
+    functions = []
+    for i, allocated in enumerate([False, True]):
+        plain = spilled_function(f"plain{i}", allocated)
+        optimized = PeepholeOptimizer(spilled_function(f"opt{i}", allocated))
+        functions += [
+            plain.function_definition,
+            optimized.optimize().function_definition,
+        ]
+        assert optimized.rule_counts["dead_scratch"] or optimized.rule_counts[
+            "store_reload"
+        ]
+    results = run_functions(functions)
+    assert results == [results[0]] * len(results)
@@ -0,0 +1,20 @@
+from api import compile_string, preprocess_string
+from preprocessor import Preprocessor
+
+
+def squeeze(text: str) -> str:
+    return "".join(text.split())
+
+
+def test_deep_macro_chain():
+    # Deeper than the default recursion limit
+    chain = "".join(f"#define M{i} M{i + 1}\n" for i in range(1500))
+    source = chain + "#define M1500 7\nint main(void) { return -M0; }\n"
+    assert squeeze(preprocess_string(source)) == "intmain(void){return-7;}"
+    assert compile_string(source, stop="tacky").function_definition.body
+
+
+def test_self_reference_is_not_expanded_again():
+    source = "#define A B A\n#define B -A\nint main(void) { return A; }\n"
+    output = Preprocessor().preprocess_source(source)
+    assert squeeze(output) == "intmain(void){return-AA;}"
@@ -0,0 +1,84 @@
+import random
+from assembly_generator import AssemblyGenerator, Register
+from conftest import interpret, requires_gcc
+from peephole import PeepholeOptimizer
+from register_allocator import ALLOCATABLE_REGISTERS, RegisterAllocator
+from tacky import (
+    TACKY_COMPLEMENT,
+    TACKY_NEGATE,
+    TackyCopy,
+    TackyFunction,
+    TackyProgram,
+    TackyReturn,
+    TackyUnary,
+    TackyVar,
+    make_constant,
+)
+
+
+def random_body(rng: random.Random, length: int) -> list:
+    # Straight-line TACKY over a small pool of variables, so many values
+    # are live at once and are redefined while others still need them
+    defined: list[TackyVar] = []
+    body = []
+    for _ in range(length):
+        dst = TackyVar(f"v{rng.randrange(12)}")
+        if defined and rng.random() < 0.8:
+            src = rng.choice(defined)
+        else:
+            value = rng.choice([0, 1, 7, 255, 2147483647, rng.randrange(1 << 31)])
+            src = make_constant(value)
+        if rng.random() < 0.5:
+            operator = rng.choice([TACKY_NEGATE, TACKY_COMPLEMENT])
+            body.append(TackyUnary(operator, src, dst))
+        else:
+            body.append(TackyCopy(src, dst))
+        if dst not in defined:
+            defined.append(dst)
+    body.append(TackyReturn(rng.choice(defined)))
+    return body
+
+
+def generate(body: list, name: str, registers: list[Register], peephole: bool):
+    allocator = RegisterAllocator(registers)
+    program = TackyProgram(TackyFunction(name, body))
+    assembly = AssemblyGenerator(program, allocator).generate_assembly_ast()
+    if peephole:
+        assembly = PeepholeOptimizer(assembly).optimize()
+    return assembly.function_definition, allocator
+
+
+@requires_gcc
+def test_allocated_code_matches_interpreter(run_functions):
+    rng = random.Random(9)
+    bodies = [random_body(rng, rng.randrange(4, 40)) for _ in range(40)]
+    expected = [interpret(body) for body in bodies]
+    for k in (0, 2, len(ALLOCATABLE_REGISTERS)):
+        for peephole in (False, True):
+            functions = []
+            spilled = 0
+            for i, body in enumerate(bodies):
+                function, allocator = generate(
+                    body, f"f{i}", ALLOCATABLE_REGISTERS[:k], peephole
+                )
+                functions.append(function)
+                spilled += len(allocator.spilled)
+            assert run_functions(functions) == expected, (k, peephole)
+            if k < len(ALLOCATABLE_REGISTERS):
+                assert spilled, "no program needed to spill"
+
+
+def test_spilled_values_share_slots_only_when_disjoint():
+    # a and b are live together; c is defined once a is dead, so it may
+    # reuse a's slot but never b's
+    a, b, c = TackyVar("a"), TackyVar("b"), TackyVar("c")
+    body = [
+        TackyCopy(make_constant(1), a),
+        TackyCopy(make_constant(2), b),
+        TackyUnary(TACKY_NEGATE, a, c),
+        TackyUnary(TACKY_COMPLEMENT, b, b),
+        TackyReturn(c),
+    ]
+    _, allocator = generate(body, "main", [], False)
+    assert sorted(allocator.spilled) == ["a", "b", "c"]
+    assert allocator.stack_size == 8
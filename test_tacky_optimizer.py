@@ -0,0 +1,121 @@
+import pytest
+from api import compile_string
+from conftest import interpret
+from tacky import (
+    TACKY_COMPLEMENT,
+    TACKY_NEGATE,
+    TackyCopy,
+    TackyFunction,
+    TackyProgram,
+    TackyReturn,
+    TackyUnary,
+    TackyVar,
+    make_constant,
+)
+from tacky_optimizer import TackyOptimizer
+
+
+P, Q = TackyVar("p"), TackyVar("q")
+T1, T2, T3, T4 = (TackyVar(f"t{i}") for i in range(1, 5))
+INPUTS = [{"p": p, "q": q} for p in (0, 5, -7, 2147483647) for q in (1, -1, 9)]
+
+# p and q are never written before they are read, so constant folding leaves
+# them alone and every operation on them reaches value numbering
+NUMBERING_BODY = [
+    TackyUnary(TACKY_NEGATE, P, T1),
+    # same (operator, src) as t1: becomes a copy of t1
+    TackyUnary(TACKY_NEGATE, P, T2),
+    # the destination t1 is redefined, so -p no longer lives in t1
+    TackyUnary(TACKY_COMPLEMENT, Q, T1),
+    TackyUnary(TACKY_NEGATE, P, T3),
+    # the source p is redefined, so -p has to be computed again
+    TackyUnary(TACKY_COMPLEMENT, Q, P),
+    TackyUnary(TACKY_NEGATE, P, T4),
+]
+
+
+def optimize(body: list) -> tuple[list, dict[str, int]]:
+    optimizer = TackyOptimizer(TackyProgram(TackyFunction("main", body)))
+    return optimizer.optimize().function_definition.body, optimizer.stats
+
+
+@pytest.mark.parametrize("target", [T1, T2, T3, T4, P])
+def test_value_numbering_matches_interpreter(target):
+    body = NUMBERING_BODY + [TackyReturn(target)]
+    optimized, stats = optimize(body)
+    assert stats["value_numbering"] > 0
+    for inputs in INPUTS:
+        assert interpret(optimized, inputs) == interpret(body, inputs), inputs
+
+
+def test_value_numbering_reuses_only_intact_results():
+    body = NUMBERING_BODY + [TackyReturn(T4)]
+    optimizer = TackyOptimizer(TackyProgram(TackyFunction("main", body)))
+    optimizer.stats["value_numbering"] = 0
+    numbered = optimizer.number_values(body)
+    assert numbered[1] == TackyCopy(T1, T2)
+    # t1 was clobbered and p was redefined, so both are computed again
+    assert numbered[3] == TackyUnary(TACKY_NEGATE, P, T3)
+    # ~q is still intact in t1
+    assert numbered[4] == TackyCopy(T1, P)
+    assert numbered[5] == TackyUnary(TACKY_NEGATE, P, T4)
+    assert optimizer.stats["value_numbering"] == 2
+
+
+@pytest.mark.parametrize(
+    "expression, value",
+    [
+        ("-(-2147483648)", -2147483648),
+        ("~2147483647", -2147483648),
+        ("-2147483648", -2147483648),
+        ("-4294967297", -1),
+        ("~4294967296", -1),
+        ("-1099511627776", 0),
+        ("~-~-7", 5),
+    ],
+)
+def test_constant_folding_wraps_to_int32(expression, value):
+    program = compile_string(
+        f"int main(void) {{ return {expression}; }}",
+        stop="tacky",
+        opt_level=1,
+        preprocess=False,
+    )
+    assert program.function_definition.body == [TackyReturn(make_constant(value))]
+
+
+def test_folded_chain_leaves_a_single_return():
+    source = "int main(void) { return -~5; }"
+    program = compile_string(source, stop="tacky", opt_level=1, preprocess=False)
+    assert program.function_definition.body == [TackyReturn(make_constant(6))]
+
+
+def test_copy_propagation_replaces_uses():
+    body = [
+        TackyCopy(P, T1),
+        TackyUnary(TACKY_NEGATE, T1, T2),
+        TackyReturn(T2),
+    ]
+    optimized, stats = optimize(body)
+    assert stats["copy_propagation"] > 0
+    assert optimized == [TackyUnary(TACKY_NEGATE, P, T2), TackyReturn(T2)]
+
+
+def test_copy_propagation_stops_at_redefined_source():
+    # p changes after t1 = p, so -t1 must still read the old p
+    body = [
+        TackyCopy(P, T1),
+        TackyUnary(TACKY_COMPLEMENT, Q, P),
+        TackyUnary(TACKY_NEGATE, T1, T2),
+        TackyUnary(TACKY_NEGATE, P, T3),
+        TackyCopy(T2, T4),
+        TackyReturn(T4),
+    ]
+    optimizer = TackyOptimizer(TackyProgram(TackyFunction("main", body)))
+    optimizer.stats["copy_propagation"] = 0
+    propagated = optimizer.propagate_copies(body)
+    assert propagated[2] == TackyUnary(TACKY_NEGATE, T1, T2)
+    assert propagated[4] == TackyCopy(T2, T4)
+    optimized, _ = optimize(body)
+    for inputs in INPUTS:
+        assert interpret(optimized, inputs) == interpret(body, inputs), inputs